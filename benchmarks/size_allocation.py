@@ -0,0 +1,58 @@
+# Allocates a limited stock of 50 sizes to 2,000 players.
+# Run from the project root: python benchmarks/size_allocation.py
+
+import os
+import random
+import sys
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'notonlylarps.settings')
+django.setup()
+
+from larps.models import PlayerMeasurement, UniformSize
+from larps.uniform_fit import SizeIndex, StockAllocation, get_measurements
+
+NUMBER_OF_PLAYERS = 2000
+NUMBER_OF_SIZES = 50
+
+
+def create_sizes(generator):
+    sizes = []
+    for i in range(0, NUMBER_OF_SIZES):
+        chest_min = 70 + i * 2 + generator.randint(0, 2)
+        waist_min = 55 + i * 2 + generator.randint(0, 2)
+        sizes.append(UniformSize(american_size=str(i), european_size=str(i),
+                                 chest_min=chest_min, chest_max=chest_min + 4,
+                                 waist_min=waist_min, waist_max=waist_min + 4))
+    return sizes
+
+
+def create_players(generator):
+    players = []
+    for _ in range(0, NUMBER_OF_PLAYERS):
+        chest = int(generator.gauss(120, 15))
+        players.append(PlayerMeasurement(chest=chest, waist=chest - 15 + generator.randint(-5, 5)))
+    return players
+
+
+def main():
+    generator = random.Random(0)
+    size_index = SizeIndex(create_sizes(generator))
+    players = create_players(generator)
+    costs = [dict(enumerate(size_index.distances(get_measurements(player)))) for player in players]
+
+    for total_stock in (NUMBER_OF_PLAYERS * 3 // 4, NUMBER_OF_PLAYERS, NUMBER_OF_PLAYERS * 5 // 4):
+        stock = [total_stock // NUMBER_OF_SIZES] * NUMBER_OF_SIZES
+        start = time.perf_counter()
+        allocation = StockAllocation(costs, stock).solve()
+        elapsed = time.perf_counter() - start
+        unallocated = len([position for position in allocation if position is None])
+        print("%d players x %d sizes, stock %d: %8.1f ms, %d unallocated"
+              % (NUMBER_OF_PLAYERS, NUMBER_OF_SIZES, total_stock, elapsed * 1000, unallocated))
+
+
+if __name__ == '__main__':
+    main()
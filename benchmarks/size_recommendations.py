@@ -0,0 +1,73 @@
+# Compares the uniform size recommendation engines on 5,000 players and 40 sizes.
+# Run from the project root: python benchmarks/size_recommendations.py
+
+import os
+import random
+import sys
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'notonlylarps.settings')
+django.setup()
+
+from larps.models import Uniform, UniformSize
+from larps.uniform_fit import SizeIndex
+
+NUMBER_OF_PLAYERS = 5000
+NUMBER_OF_SIZES = 40
+
+
+def create_sizes(generator):
+    sizes = []
+    for i in range(0, NUMBER_OF_SIZES):
+        chest_min = 70 + i * 2 + generator.randint(0, 2)
+        waist_min = 55 + i * 2 + generator.randint(0, 2)
+        sizes.append(UniformSize(american_size=str(i), european_size=str(i),
+                                 chest_min=chest_min, chest_max=chest_min + 4,
+                                 waist_min=waist_min, waist_max=waist_min + 4))
+    return sizes
+
+
+def brute_force(uniform, sizes, measurements):
+    recommendations = []
+    for chest, waist in measurements:
+        perfect_fit = uniform.find_perfect_fit(sizes, chest, waist)
+        if perfect_fit:
+            recommendations.append(perfect_fit)
+        else:
+            recommendations.append(uniform.find_valid_fit(sizes, chest, waist))
+    return recommendations
+
+
+def indexed(size_index, measurements):
+    return [size_index.recommend(chest, waist) for chest, waist in measurements]
+
+
+def batch(size_index, measurements):
+    return size_index.recommend_batch(measurements)
+
+
+def measure(name, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    print("%-12s %8.1f ms" % (name, elapsed * 1000))
+    return result
+
+
+def main():
+    generator = random.Random(0)
+    sizes = create_sizes(generator)
+    measurements = [(generator.randint(65, 160), generator.randint(50, 145)) for _ in range(0, NUMBER_OF_PLAYERS)]
+    print("%d players x %d sizes" % (NUMBER_OF_PLAYERS, NUMBER_OF_SIZES))
+
+    expected = measure("brute force", brute_force, Uniform(name=""), sizes, measurements)
+    size_index = measure("build index", SizeIndex, sizes)
+    assert measure("indexed", indexed, size_index, measurements) == expected
+    assert measure("batch", batch, size_index, measurements) == expected
+
+
+if __name__ == '__main__':
+    main()
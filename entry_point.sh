@@ -10,4 +10,10 @@ python manage.py shell < init_admin.py
 python manage.py makemigrations app
 python manage.py migrate app
 echo "Django is ready.";
+# the import worker is started again whenever it stops.
+(while true; do
+  python manage.py run_import_jobs
+  echo "Import worker stopped, restarting.";
+  sleep 2
+done) &
 python manage.py runserver 0.0.0.0:8000
\ No newline at end of file
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class LarpsConfig(AppConfig):
     name = 'larps'
+
+    def ready(self):
+        from . import signals
@@ -1,5 +1,8 @@
-import csv, io
+import codecs, csv, io
+from itertools import islice
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
 from .models import *
 from config import *
 
@@ -9,34 +12,100 @@ from config import *
 def empty(name):
     return not name.strip()
 
-def get_larp(larp_name):
-    larp_search = Larp.objects.filter(name=larp_name)
-    if larp_search:
-        return larp_search[0]
-    else:
-        larp = Larp(name=larp_name)
-        larp.save()
-        return larp
+class RowLookups:
+    """Larps, groups, races and character types by name, looked up with one filtered query each.
 
-def get_group(group_name, larp_name):
-    if empty(larp_name) or empty(group_name):
-        return None
-    larp = get_larp(larp_name)
-    search = Group.objects.filter(name=group_name, larp=larp)
-    if search:
-        return search[0]
-    else:
-        group = Group(name=group_name, larp=larp)
-        group.save()
+    Used when a single row is processed. ImportSession reads them for a whole file instead.
+    """
+
+    # returns the instance with these values (the first one found), creating it if needed.
+    def get_or_create(self, model, **values):
+        instance = model.objects.filter(**values).order_by('id').first()
+        return instance or self.create(model, values)
+
+    def create(self, model, values):
+        instance = model(**values)
+        instance.save()
+        return instance
+
+    def get_larp(self, larp_name):
+        return self.get_or_create(Larp, name=larp_name)
+
+    def get_group(self, group_name, larp_name):
+        if empty(larp_name) or empty(group_name):
+            return None
+        larp = self.get_larp(larp_name)
+        group = self.get_or_create(Group, name=group_name, larp_id=larp.id)
+        group.larp = larp
         return group
 
+    def get_race(self, race_name):
+        return self.get_or_create(Race, name=race_name)
+
+    def get_character_type(self, type_name):
+        return self.get_or_create(CharacterType, name=type_name)
+
+
+class ImportSession(RowLookups):
+    """Larps, groups, races and character types of the database by name, for a whole CSV file.
+
+    A casting file only has a few of them, so every table is read once (the first time it is
+    needed) and the ones created by the rows are added, instead of querying them on every row.
+    """
+
+    def __init__(self):
+        self.instances = {}
+
+    # returns the instances of the model by key, reading the table the first time.
+    def get_instances(self, model, key):
+        if model not in self.instances:
+            instances = {}
+            for instance in model.objects.order_by('id'):
+                instances.setdefault(key(instance), instance)
+            self.instances[model] = instances
+        return self.instances[model]
+
+    # returns the instance with these values (the first one, like the filters it replaces), creating it if needed.
+    def get_or_create(self, model, **values):
+        fields = list(values.keys())
+        instances = self.get_instances(model, lambda instance: tuple(getattr(instance, field) for field in fields))
+        key = tuple(values.values())
+        if key not in instances:
+            instances[key] = self.create(model, values)
+        return instances[key]
+
+
+class PreviewSession(ImportSession):
+    """ImportSession of a dry run: the missing instances are built but never saved.
+
+    They get a negative placeholder id, so the rows using them have different keys and can
+    never match an existing row of the database.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.last_placeholder_id = 0
+
+    def create(self, model, values):
+        self.last_placeholder_id -= 1
+        return model(id=self.last_placeholder_id, **values)
+
+
+def get_larp(larp_name, session=None):
+    return (session or RowLookups()).get_larp(larp_name)
+
+def get_group(group_name, larp_name, session=None):
+    return (session or RowLookups()).get_group(group_name, larp_name)
+
+# returns the username, first name and last name of a player.
+def split_player_name(player_name):
+    name_parts = player_name.split(' ')
+    return "_".join(name_parts), name_parts[0], " ".join(name_parts[1:])
+
 def create_user(player_name, email):
     if empty(player_name): return None
 
-    name_parts = player_name.split(' ')
-    username = "_".join(name_parts)
-    first_name = name_parts[0]
-    last_name = " ".join(name_parts[1:])
+    username, first_name, last_name = split_player_name(player_name)
 
     user, created = User.objects.update_or_create(username=username)
     user.first_name = first_name
@@ -46,13 +115,14 @@ def create_user(player_name, email):
     return user
 
 
-def create_character(larp_name, character_name, group, race, rank, type, concept, sheet, weapon):
+def create_character(larp_name, character_name, group, race, rank, type, concept, sheet, weapon, session=None):
     if empty(character_name) and empty(group) and empty(race):
         return None
 
-    group = get_group(group, larp_name)
-    race, created = Race.objects.update_or_create(name=race)
-    type, created = CharacterType.objects.update_or_create(name=type)
+    session = session or RowLookups()
+    group = session.get_group(group, larp_name)
+    race = session.get_race(race)
+    type = session.get_character_type(type)
 
     character, created = Character.objects.update_or_create(
         name=character_name, group=group, race=race, rank=rank, type=type,
@@ -60,55 +130,197 @@ def create_character(larp_name, character_name, group, race, rank, type, concept
     return character
 
 
+def assigment_result(user, character, assigned):
+    if assigned:
+        return "Character "+ character.name + " assigned to " + user.first_name + " " + user.last_name
+    return "Not assigned."
+
+def invalid_row_result(user, character):
+    if not user:
+        result = "User invalid"
+    else:
+        result = "Created user " + user.first_name + " " + user.last_name
+    if not character:
+        result += ". Character invalid"
+    return result
+
 def assign_character_to_user(user, character, run):
-    _, created = CharacterAssigment.objects.update_or_create(
+    # a character has one assigment per run: importing it again with another player reassigns it.
+    assigment, created = CharacterAssigment.objects.get_or_create(
         run = run,
         character=character,
-        user=user
+        defaults={'user': user}
     )
-    if created:
-        result = "Character "+ character.name + " assigned to " + user.first_name + " " + user.last_name
-    else:
-        result = "Not assigned."
-    return result
+    if not created and assigment.user_id != user.id:
+        assigment.user = user
+        assigment.save()
+        created = True
+    return assigment_result(user, character, created)
 
 
 # PROCESS CSV FILE
 
-def process_character_info(column):
+CHARACTER_COLUMNS = ["larp", "run", "email", "player_name", "character_name", "group",
+                     "race", "rank", "type", "concept", "sheet", "weapon"]
+
+def parse_character_info(column):
     # larp;run;email;name;character;group;race;rank;type;concept;sheet;weapon
-    larp = column[0]
-    run = column[1]
-    email = column[2]
-    player_name = column[3]
-    character_name = column[4]
-    group = column[5]
-    race = column[6]
-    rank = column[7]
-    type = column[8]
-    concept = column[9]
-    sheet = column[10]
-    weapon = column[11]
-
-    user = create_user(player_name, email)
-    character = create_character(larp, character_name, group, race, rank,
-                                type, concept, sheet, weapon)
+    return {name: column[index] for index, name in enumerate(CHARACTER_COLUMNS)}
+
+def process_character_info(column, session=None):
+    row = parse_character_info(column)
+    user = create_user(row["player_name"], row["email"])
+    character = create_character(row["larp"], row["character_name"], row["group"], row["race"], row["rank"],
+                                row["type"], row["concept"], row["sheet"], row["weapon"], session=session)
 
     if user and character:
-        result = assign_character_to_user(user, character, run)
+        result = assign_character_to_user(user, character, row["run"])
     else:
-        if not user:
-            result = "User invalid"
-        else:
-            result = "Created user " + user.first_name + " " + user.last_name
-        if not character:
-            result += ". Character invalid"
+        result = invalid_row_result(user, character)
     return result
 
+
+# BULK IMPORT OF CHARACTERS
+# Same results as process_character_info for every row, but the existing rows of the whole file
+# are loaded with a few IN queries and the new ones are written together in one transaction.
+
+def is_valid_character(row):
+    return not (empty(row["character_name"]) and empty(row["group"]) and empty(row["race"]))
+
+def filter_by_values(model, fields, keys):
+    query = Q()
+    for position, field in enumerate(fields):
+        values = set(key[position] for key in keys)
+        condition = Q(**{field + "__in": values - {None}})
+        if None in values:
+            condition |= Q(**{field + "__isnull": True})
+        query &= condition
+    return model.objects.filter(query).order_by('id')
+
+# returns {key: instance} for every key (tuple of values of fields). The first existing row is used,
+# as get_larp and get_group do, and the missing ones are created with a single bulk insert.
+def get_or_create_all(model, fields, keys):
+    instances = {}
+    def load(keys):
+        for instance in filter_by_values(model, fields, keys):
+            key = tuple(getattr(instance, field) for field in fields)
+            if key in keys:
+                instances.setdefault(key, instance)
+
+    keys = set(keys)
+    if not keys:
+        return instances
+    load(keys)
+    missing = [key for key in keys if key not in instances]
+    if missing:
+        model.objects.bulk_create([model(**dict(zip(fields, key))) for key in missing])
+        # bulk_create does not set the ids on every database, so the new rows are read again.
+        load(set(missing))
+    return instances
+
+# creates or updates the users of the file, the last row of every user wins like in create_user.
+def import_users(rows):
+    users_info = {}
+    for row in rows:
+        if not empty(row["player_name"]):
+            username, first_name, last_name = split_player_name(row["player_name"])
+            users_info[username] = (first_name, last_name, row["email"])
+    if not users_info:
+        return {}
+
+    existing_users = []
+    new_users = []
+    users = {user.username: user for user in User.objects.filter(username__in=users_info.keys())}
+    for username, (first_name, last_name, email) in users_info.items():
+        user = users.get(username)
+        if user:
+            user.first_name, user.last_name, user.email = first_name, last_name, email
+            existing_users.append(user)
+        else:
+            new_users.append(User(username=username, first_name=first_name, last_name=last_name, email=email))
+    User.objects.bulk_update(existing_users, ['first_name', 'last_name', 'email'])
+    if new_users:
+        User.objects.bulk_create(new_users)
+        users.update({user.username: user for user in User.objects.filter(username__in=[user.username for user in new_users])})
+    return users
+
+CHARACTER_FIELDS = ['name', 'group_id', 'race_id', 'rank', 'type_id', 'concept', 'sheet', 'weapon']
+
+# returns the character of every valid row (None for the others), creating the ones that do not exist.
+def import_characters_info(rows, session):
+    keys = []
+    groups = {}
+    for row in rows:
+        if not is_valid_character(row):
+            keys.append(None)
+            continue
+        group = session.get_group(row["group"], row["larp"])
+        if group:
+            groups[group.id] = group
+        keys.append((row["character_name"], group.id if group else None, session.get_race(row["race"]).id,
+                     row["rank"], session.get_character_type(row["type"]).id, row["concept"], row["sheet"], row["weapon"]))
+    characters = get_or_create_all(Character, CHARACTER_FIELDS, [key for key in keys if key])
+    for character in characters.values():
+        character.group = groups.get(character.group_id)
+    return [characters[key] if key else None for key in keys]
+
+# assigns the characters row by row, like assign_character_to_user, and saves the assigments together.
+def import_assigments(rows, users, characters):
+    row_users = []
+    for row in rows:
+        row_users.append(users[split_player_name(row["player_name"])[0]] if not empty(row["player_name"]) else None)
+    runs = [int(row["run"]) if user and character else None for row, user, character in zip(rows, row_users, characters)]
+
+    assigments = {}
+    character_ids = [character.id for character in characters if character]
+    for assigment in CharacterAssigment.objects.filter(character__in=character_ids, run__in=set(runs) - {None}):
+        assigments[(assigment.character_id, assigment.run)] = assigment
+
+    results = []
+    new_assigments = {}
+    updated_assigments = {}
+    for user, run, character in zip(row_users, runs, characters):
+        if not (user and character):
+            results.append(invalid_row_result(user, character))
+            continue
+        key = (character.id, run)
+        assigment = assigments.get(key)
+        assigned = True
+        if not assigment:
+            # the larp is set here because bulk_create does not send the pre_save signal.
+            larp_id = character.group.larp_id if character.group else None
+            assigment = CharacterAssigment(character=character, run=run, user=user, larp_id=larp_id)
+            assigments[key] = new_assigments[key] = assigment
+        elif assigment.user_id != user.id:
+            assigment.user = user
+            if key not in new_assigments:
+                updated_assigments[key] = assigment
+        else:
+            assigned = False
+        results.append(assigment_result(user, character, assigned))
+
+    CharacterAssigment.objects.bulk_create(new_assigments.values())
+    CharacterAssigment.objects.bulk_update(updated_assigments.values(), ['user'])
+    return results
+
+def import_characters(columns, session=None):
+    rows = [parse_character_info(column) for column in columns]
+    session = session or ImportSession()
+    with transaction.atomic():
+        users = import_users(rows)
+        characters = import_characters_info(rows, session)
+        return import_assigments(rows, users, characters)
+
 def create_uniform(uniform_name):
     uniform, created = Uniform.objects.update_or_create(name=uniform_name)
     return uniform
 
+# returns the value of the column or an empty string if the line is shorter.
+def get_column(column, index):
+    if index < len(column):
+        return column[index]
+    return ""
+
 def process_size_info(column):
     # uniform_name	gender	american_size	european_size	chest_min	chest_max	arm_min	arm_max	waist_min	waist_max	shoulder_ min	shoulder_max	torso_min	torso_max	body_min	body_max
     size_information = {}
@@ -121,6 +333,12 @@ def process_size_info(column):
     size_information["arm_max"] = column[7]
     size_information["waist_min"] = column[8]
     size_information["waist_max"] = column[9]
+    size_information["shoulder_min"] = get_column(column, 10)
+    size_information["shoulder_max"] = get_column(column, 11)
+    size_information["torso_min"] = get_column(column, 12)
+    size_information["torso_max"] = get_column(column, 13)
+    size_information["body_min"] = get_column(column, 14)
+    size_information["body_max"] = get_column(column, 15)
     return size_information
 
 def process_uniform_info(column):
@@ -153,24 +371,205 @@ def get_file_type(header):
             file_type = f["file_type"]
     return file_type
 
-def process_data(data_set):
-    io_string = io.StringIO(data_set)
-    header = next(io_string)
+# rows read and written together by the character importer.
+IMPORT_BATCH_SIZE = 500
+
+def get_batches(rows, size=None):
+    size = size or IMPORT_BATCH_SIZE
+    rows = iter(rows)
+    batch = list(islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, size))
+
+# processes the lines of a CSV file (with their line endings), reading them as they are needed.
+# The whole file is imported in one transaction and returns the result of every row. With
+# on_batch, the results of every batch are given to on_batch(results of the batch) instead and
+# are not kept, so only the file type error is returned.
+def process_lines(lines, on_batch=None):
+    lines = iter(lines)
+    header = next(lines, "")
     file_type = get_file_type(header)
     if file_type == "incorrect":
         return ["Incorrect file type"]
 
+    rows = csv.reader(lines, delimiter=';', quotechar="|")
+    session = ImportSession()
     result = []
-    for column in csv.reader(io_string, delimiter=';', quotechar="|"):
-        r = process_csv_line(column, file_type)
-        result.append(r)
+    if on_batch is None:
+        on_batch = result.extend
+    with transaction.atomic():
+        for batch in get_batches(rows):
+            if file_type == csv_file_types()[0][0]:
+                batch_result = import_characters(batch, session)
+            else:
+                batch_result = [process_csv_line(column, file_type) for column in batch]
+            on_batch(batch_result)
     return result
 
-def read_csv_file(file):
-    data_set = file.read().decode('UTF-8')
-    return data_set
+def process_data(data_set):
+    return process_lines(io.StringIO(data_set))
 
-def process_csv(file):
-    data_set = read_csv_file(file)
-    result = process_data(data_set)
-    return result
+ERROR_RESULTS = ["User invalid", "Character invalid", "NOT PROCESSED", "not recognised"]
+
+def is_error_result(result):
+    return any(error in result for error in ERROR_RESULTS)
+
+# returns the lines of the uploaded file, decoding its chunks as they arrive. A character split
+# between two chunks is kept by the decoder and the last line of a chunk waits for the next one.
+def read_csv_lines(file):
+    decoder = codecs.getincrementaldecoder('UTF-8')()
+    pending = ""
+    for chunk in file.chunks():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+def process_csv(file, on_batch=None):
+    return process_lines(read_csv_lines(file), on_batch)
+
+
+# DRY RUN
+# Changes that importing a characters file would make, computed with the same few bulk queries
+# as the import (users, the session tables, characters and assigments) and without writing anything.
+
+# returns {username: unsaved user} of the players of the file that do not exist yet, the last row of every user wins.
+def preview_new_users(rows):
+    usernames = set(split_player_name(row["player_name"])[0] for row in rows if not empty(row["player_name"]))
+    existing_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    new_users = {}
+    for row in rows:
+        if not empty(row["player_name"]):
+            username, first_name, last_name = split_player_name(row["player_name"])
+            if username not in existing_usernames:
+                new_users[username] = User(username=username, first_name=first_name, last_name=last_name, email=row["email"])
+    return new_users
+
+# returns the user of the row as it would be after the import (unsaved), None without player name.
+def preview_user(row, new_users):
+    if empty(row["player_name"]):
+        return None
+    username, first_name, last_name = split_player_name(row["player_name"])
+    return new_users.get(username) or User(username=username, first_name=first_name, last_name=last_name, email=row["email"])
+
+# returns the character of every valid row (None for the others), the new ones built with a placeholder id.
+def preview_characters_info(rows, session):
+    keys = []
+    for row in rows:
+        if not is_valid_character(row):
+            keys.append(None)
+            continue
+        group = session.get_group(row["group"], row["larp"])
+        keys.append((row["character_name"], group, session.get_race(row["race"]).id, row["rank"],
+                     session.get_character_type(row["type"]).id, row["concept"], row["sheet"], row["weapon"]))
+
+    def character_key(key):
+        group = key[1]
+        return (key[0], group.id if group else None) + key[2:]
+    characters = {}
+    existing_keys = [character_key(key) for key in keys if key]
+    for character in filter_by_values(Character, CHARACTER_FIELDS, existing_keys):
+        characters.setdefault(tuple(getattr(character, field) for field in CHARACTER_FIELDS), character)
+
+    new_characters = []
+    row_characters = []
+    for key in keys:
+        if not key:
+            row_characters.append(None)
+            continue
+        if character_key(key) not in characters:
+            character = session.create(Character, dict(zip(CHARACTER_FIELDS, character_key(key))))
+            characters[character_key(key)] = character
+            new_characters.append(character)
+        character = characters[character_key(key)]
+        character.group = key[1]
+        row_characters.append(character)
+    return row_characters, new_characters
+
+# returns the run number of a row, None if it is not a number.
+def parse_run(run):
+    try:
+        return int(run)
+    except ValueError:
+        return None
+
+# returns the changes of a characters file: new users, new characters, characters assigned for
+# the first time in a run, reassigned characters (with their previous player) and invalid rows.
+def preview_import_characters(columns):
+    lines = []
+    rows = []
+    invalid = []
+    # the rows the import can not read are reported instead of raising an error.
+    for line, column in enumerate(columns, start=2):
+        if len(column) < len(CHARACTER_COLUMNS):
+            invalid.append({"line": line, "result": "Incomplete row: " + str(len(column)) + " of " + str(len(CHARACTER_COLUMNS)) + " columns"})
+        else:
+            lines.append(line)
+            rows.append(parse_character_info(column))
+    new_users = preview_new_users(rows)
+    characters, new_characters = preview_characters_info(rows, PreviewSession())
+
+    runs = set(parse_run(row["run"]) for row, character in zip(rows, characters) if character and not empty(row["player_name"]))
+    character_ids = [character.id for character in characters if character and character.id > 0]
+    assigned_users = {}
+    for assigment in CharacterAssigment.objects.filter(character__in=character_ids, run__in=runs - {None}).select_related('user'):
+        assigned_users[(assigment.character_id, assigment.run)] = assigment.user
+
+    diff = {"new_users": list(new_users.values()), "new_characters": new_characters,
+            "assigned": [], "reassigned": [], "invalid": invalid}
+    for line, row, character in zip(lines, rows, characters):
+        user = preview_user(row, new_users)
+        run = parse_run(row["run"])
+        if not (user and character):
+            invalid.append({"line": line, "result": invalid_row_result(user, character)})
+            continue
+        if run is None:
+            invalid.append({"line": line, "result": "Invalid run: " + row["run"]})
+            continue
+        key = (character.id, run)
+        previous_user = assigned_users.get(key)
+        if not previous_user:
+            diff["assigned"].append({"character": character, "run": run, "user": user})
+        elif previous_user.username != user.username:
+            diff["reassigned"].append({"character": character, "run": run, "user": user, "previous_user": previous_user})
+        assigned_users[key] = user
+    invalid.sort(key=lambda row: row["line"])
+    return diff
+
+# returns the changes of importing the lines of a CSV file, or {"error": message} for other files.
+def preview_lines(lines):
+    lines = iter(lines)
+    file_type = get_file_type(next(lines, ""))
+    if file_type == "incorrect":
+        return {"error": "Incorrect file type"}
+    if file_type != csv_file_types()[0][0]:
+        return {"error": "The dry run is only available for characters files"}
+    return preview_import_characters(csv.reader(lines, delimiter=';', quotechar="|"))
+
+def preview_csv(file):
+    return preview_lines(read_csv_lines(file))
+
+
+# IMPORT JOBS
+
+# imports the file of a job claimed by the worker (ImportJob.objects.claim_next), reporting its
+# progress every batch. A job that fails leaves nothing imported.
+def run_import_job(job):
+    def save_progress(results):
+        job.save_progress(results, len([result for result in results if is_error_result(result)]))
+
+    try:
+        with job.file.open('rb') as file:
+            result = process_csv(file, on_batch=save_progress)
+    except Exception as error:
+        job.finish(ImportJob.FAILED, "Nothing was imported: " + str(error))
+    else:
+        if result == ["Incorrect file type"]:
+            job.finish(ImportJob.FAILED, result[0])
+        else:
+            job.finish(ImportJob.DONE)
+    return job
@@ -27,3 +27,4 @@ class BookingsForm(forms.Form):
 
 class ImportCSVForm(forms.Form):
     file = forms.FileField()
+    dry_run = forms.BooleanField(required=False, help_text="Show the changes without importing the file")
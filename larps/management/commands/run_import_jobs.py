@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from larps.csv_importer import run_import_job
+from larps.models import ImportJob
+
+
+class Command(BaseCommand):
+    help = "Runs the CSV import jobs uploaded on the file upload page, oldest first."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Stop when there are no pending jobs left.")
+        parser.add_argument('--interval', type=float, default=2, help="Seconds to wait for new jobs.")
+
+    def handle(self, *args, **options):
+        while True:
+            ImportJob.objects.requeue_stale()
+            job = ImportJob.objects.claim_next()
+            if job:
+                run_import_job(job)
+                self.stdout.write("%s: %d rows, %d errors, %.1f rows/s"
+                                  % (job, job.rows_processed, job.errors, job.get_throughput()))
+            elif options['once']:
+                return
+            else:
+                time.sleep(options['interval'])
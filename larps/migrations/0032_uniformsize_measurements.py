@@ -0,0 +1,53 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('larps', '0031_auto_20210418_0337'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uniformsize',
+            name='arm_max',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uniformsize',
+            name='arm_min',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uniformsize',
+            name='body_max',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uniformsize',
+            name='body_min',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uniformsize',
+            name='shoulder_max',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uniformsize',
+            name='shoulder_min',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uniformsize',
+            name='torso_max',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uniformsize',
+            name='torso_min',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('larps', '0032_uniformsize_measurements'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='characterassigment',
+            index=models.Index(fields=['user', 'run'], name='assigment_user_run_idx'),
+        ),
+    ]
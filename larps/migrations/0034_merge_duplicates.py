@@ -0,0 +1,47 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:39
+
+from django.db import migrations
+from django.db.models import Count
+
+
+# a value not filled in: no value, an empty text or a measurement of 0. False ("No") is a value.
+def is_empty(value):
+    if value is None or value == "":
+        return True
+    return not isinstance(value, bool) and isinstance(value, int) and value == 0
+
+
+# keeps one row of every group of rows with the same values in fields, fills its empty
+# values with the ones of the other rows (first found first) and deletes the others.
+def merge_duplicates(model, fields, keep_last=False):
+    ordering = '-id' if keep_last else 'id'
+    merged_fields = [field.attname for field in model._meta.concrete_fields if field.name not in fields and not field.primary_key]
+    duplicates = model.objects.values(*fields).annotate(rows=Count('id')).filter(rows__gt=1).order_by()
+    for values in duplicates:
+        rows = list(model.objects.filter(**{field: values[field] for field in fields}).order_by(ordering))
+        kept = rows[0]
+        for row in rows[1:]:
+            for field in merged_fields:
+                if is_empty(getattr(kept, field)) and not is_empty(getattr(row, field)):
+                    setattr(kept, field, getattr(row, field))
+        model.objects.filter(id__in=[row.id for row in rows[1:]]).delete()
+        kept.save()
+
+
+def merge(apps, schema_editor):
+    # the app always read the first profile and bookings found, so those are kept.
+    merge_duplicates(apps.get_model('larps', 'PlayerMeasurement'), ['user'])
+    merge_duplicates(apps.get_model('larps', 'Bookings'), ['user', 'larp', 'run'])
+    # importing a character again for the same run added a new assigment: the last one is kept.
+    merge_duplicates(apps.get_model('larps', 'CharacterAssigment'), ['character', 'run'], keep_last=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('larps', '0033_characterassigment_user_run_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('larps', '0034_merge_duplicates'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='uniformsize',
+            index=models.Index(fields=['uniform', 'gender'], name='uniformsize_uniform_gender_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookings',
+            constraint=models.UniqueConstraint(fields=('user', 'larp', 'run'), name='unique_bookings_user_larp_run'),
+        ),
+        migrations.AddConstraint(
+            model_name='characterassigment',
+            constraint=models.UniqueConstraint(fields=('character', 'run'), name='unique_character_run'),
+        ),
+        migrations.AddConstraint(
+            model_name='playermeasurement',
+            constraint=models.UniqueConstraint(fields=('user',), name='unique_player_measurement_user'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('larps', '0035_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='characterassigment',
+            name='larp',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='larps.larp'),
+        ),
+        migrations.AddIndex(
+            model_name='characterassigment',
+            index=models.Index(fields=['larp', 'run'], name='assigment_larp_run_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:40
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+# copies the larp of every character's group into its assigments, with a single update.
+def fill_larp(apps, schema_editor):
+    Character = apps.get_model('larps', 'Character')
+    CharacterAssigment = apps.get_model('larps', 'CharacterAssigment')
+    larps = Character.objects.filter(id=OuterRef('character')).values('group__larp')[:1]
+    CharacterAssigment.objects.update(larp=Subquery(larps))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('larps', '0036_characterassigment_larp'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_larp, migrations.RunPython.noop),
+    ]
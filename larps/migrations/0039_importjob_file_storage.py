@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-18 16:04
+
+from django.db import migrations, models
+import larps.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('larps', '0038_importjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='file',
+            field=models.FileField(storage=larps.models.ImportFilesStorage(), upload_to='csv_imports/'),
+        ),
+    ]
@@ -1,5 +1,14 @@
+import os
+from collections import Counter
+from django.conf import settings
 from django.db import models
+from django.db.models import BooleanField, Count, Exists, ExpressionWrapper, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+from .uniform_fit import RecommendationCache, SizeIndex, SizePartitions, StockAllocation, get_measurements
 
 
 class Gender(models.Model):
@@ -9,8 +18,41 @@ class Gender(models.Model):
         return self.name
 
 
+class GetOrInsertManager(models.Manager):
+
+    # returns the row with these values (a unique constraint), inserting it when it does not exist.
+    # The insert is INSERT ... ON CONFLICT DO NOTHING, so concurrent requests never create two rows.
+    def get_or_insert(self, **fields):
+        try:
+            return self.get(**fields)
+        except self.model.DoesNotExist:
+            self.bulk_create([self.model(**fields)], ignore_conflicts=True)
+            return self.get(**fields)
+
+
 # PLAYER MEASUREMENT
 
+class PlayerMeasurementManager(GetOrInsertManager):
+
+    # returns the profile of every user by user id, loaded with one IN query. The missing ones
+    # are inserted together (ON CONFLICT DO NOTHING) and read again to get their ids.
+    def get_or_insert_for_users(self, users):
+        users = {user.id: user for user in users}
+        profiles = {}
+        def load(user_ids):
+            for profile in self.filter(user__in=user_ids).select_related('gender').order_by('id'):
+                profile.user = users[profile.user_id]
+                profiles.setdefault(profile.user_id, profile)
+
+        if not users:
+            return profiles
+        load(users.keys())
+        missing = [user for user_id, user in users.items() if user_id not in profiles]
+        if missing:
+            self.bulk_create([self.model(user=user) for user in missing], ignore_conflicts=True)
+            load([user.id for user in missing])
+        return profiles
+
 class PlayerMeasurement(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     chest = models.IntegerField(default=0)
@@ -21,6 +63,13 @@ class PlayerMeasurement(models.Model):
     body_length = models.IntegerField(default=0)
     gender = models.ForeignKey(Gender, on_delete=models.SET_NULL, null=True)
 
+    objects = PlayerMeasurementManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user'], name='unique_player_measurement_user'),
+        ]
+
     def __str__(self):
         if self.user.first_name:
             name = self.user.first_name + " " + self.user.last_name
@@ -53,52 +102,51 @@ class PlayerMeasurement(models.Model):
 
 # LARPS AND CHARACTERS
 
+class LarpQuerySet(models.QuerySet):
+
+    # annotates every larp with its number of runs (the highest run of its assigments).
+    def with_number_of_runs(self):
+        return self.annotate(number_of_runs=Coalesce(Max('characterassigment__run'), 0))
+
+
 class Larp(models.Model):
     name = models.CharField(max_length=500)
 
+    objects = LarpQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
     def get_character_assigments(self, run_id=None):
-        groups = Group.objects.filter(larp=self)
-        character_assigments = []
-        for group in groups:
-            assigments = group.get_character_assigments(run_id=run_id)
-            character_assigments.extend(assigments)
-        return character_assigments
+        return list(CharacterAssigment.objects.for_larp(self, run_id=run_id))
 
     def get_number_of_runs(self, assigments=None):
         if not assigments:
-            assigments = self.get_character_assigments()
+            if not self.pk:
+                return 0
+            return Larp.objects.with_number_of_runs().get(pk=self.pk).number_of_runs
         number_of_runs = 0
         for assigment in assigments:
             if assigment.run > number_of_runs:
                 number_of_runs = assigment.run
         return number_of_runs
 
-    @staticmethod
-    def initialize_players_info(number_of_runs):
-        players_info = []
-        for _ in range(0, number_of_runs):
-            players_info.append([])
-        return players_info
-
-
-    def get_players_information(self):
-        assigments = self.get_character_assigments()
-        number_of_runs = self.get_number_of_runs(assigments)
-        players_info = self.initialize_players_info(number_of_runs)
+    # returns the players with missing profile or bookings information grouped by run.
+    # The missing fields are computed by the database and complete players are not loaded.
+    def get_players_missing_information(self, run_id=None):
+        assigments = CharacterAssigment.objects.for_larp(self, run_id=run_id).with_missing_info_only()
+        players_info = {}
         for assigment in assigments:
-            profile = assigment.get_player_profile()
-            bookings = assigment.get_bookings()
             if assigment.user:
                 user_name = CharacterAssigment.compose_fullname(assigment)
             else:
                 user_name = "Not assigned"
-            info = {"user": user_name, "profile": profile, "bookings": bookings, "run": assigment.run, "character": assigment.character.name}
-            run_index = assigment.run - 1
-            players_info[run_index].append(info)
-        return players_info
+            missing = {}
+            for field in CharacterAssigmentQuerySet.missing_info_conditions():
+                missing[field] = getattr(assigment, 'missing_' + field)
+            info = {"user": user_name, "run": assigment.run, "character": assigment.character.name, "missing": missing}
+            players_info.setdefault(assigment.run, []).append(info)
+        return [players_info[run] for run in sorted(players_info)]
 
     def get_players_list_info(self, run_id=None) -> {}:
         """Returns all players info by Larp ID, (and optionally run)
@@ -153,36 +201,34 @@ class Group(models.Model):
         else:
             return self.larp.name + " - " + "no group"
 
-    # returns the profiles of the players assigned to this group.
-    def get_player_profiles(self):
-        players = []
-        character_assigments = self.get_character_assigments()
+    # returns the profiles of the players assigned to this group, loaded together.
+    def get_player_profiles(self, character_assigments=None):
+        if character_assigments is None:
+            character_assigments = self.get_character_assigments()
+        users = {}
         for assigment in character_assigments:
-            player_profile = assigment.get_player_profile()
-            if player_profile:
-                # check that the profile is not already on the list.
-                if player_profile not in players:
-                    players.append(player_profile)
-        return players
+            # every player is only added once, even with characters in several runs.
+            if assigment.user:
+                users.setdefault(assigment.user_id, assigment.user)
+        profiles = PlayerMeasurement.objects.get_or_insert_for_users(users.values())
+        return [profiles[user_id] for user_id in users]
 
     def get_character_assigments(self, run_id=None):
-        character_assigments = []
-        characters_list = Character.objects.filter(group=self)
-        for character in characters_list:
-            if run_id:
-                assigments = CharacterAssigment.objects.filter(character=character, run=run_id)
-            else:
-                assigments = CharacterAssigment.objects.filter(character=character)
-            character_assigments.extend(assigments)
-        return character_assigments
+        return list(CharacterAssigment.objects.for_group(self, run_id=run_id))
 
-    def character_assigment_for_user(self, user):
-        character_assigments = self.get_character_assigments()
-        user_assigments = []
+    # returns the character assigments of this group by user id.
+    def get_assigments_by_user(self, character_assigments=None):
+        if character_assigments is None:
+            character_assigments = self.get_character_assigments()
+        assigments_by_user = {}
         for assigment in character_assigments:
-            if assigment.user == user:
-                user_assigments.append(assigment)
-        return user_assigments
+            assigments_by_user.setdefault(assigment.user_id, []).append(assigment)
+        return assigments_by_user
+
+    def character_assigment_for_user(self, user, assigments_by_user=None):
+        if assigments_by_user is None:
+            assigments_by_user = self.get_assigments_by_user()
+        return assigments_by_user.get(user.id, [])
 
 
 class Race(models.Model):
@@ -215,17 +261,134 @@ class Character(models.Model):
         return self.name
 
 
+class CharacterAssigmentQuerySet(models.QuerySet):
+
+    # loads the character (with group, larp, race and type) and the user in the same query.
+    def with_related(self):
+        return self.select_related('character', 'character__group', 'larp',
+                                   'character__race', 'character__type', 'user')
+
+    def for_run(self, run_id=None):
+        if run_id:
+            return self.filter(run=run_id)
+        return self
+
+    def for_larp(self, larp, run_id=None):
+        if not larp.pk:
+            return self.none()
+        assigments = self.filter(larp=larp).for_run(run_id)
+        return assigments.with_related().order_by('character__group', 'character', 'id')
+
+    # annotates every assigment with a missing_<field> flag for each profile and bookings field
+    # that the player still has to fill (the first profile and bookings rows are used).
+    def with_missing_info(self):
+        profiles = PlayerMeasurement.objects.filter(user=OuterRef('user')).order_by('id')
+        bookings = Bookings.objects.filter(user=OuterRef('user'), larp=OuterRef('larp'),
+                                           run=OuterRef('run')).order_by('id')
+        assigments = self.annotate(
+            profile_id=Subquery(profiles.values('id')[:1]),
+            profile_chest=Subquery(profiles.values('chest')[:1]),
+            profile_waist=Subquery(profiles.values('waist')[:1]),
+            profile_gender=Subquery(profiles.values('gender')[:1]),
+            bookings_id=Subquery(bookings.values('id')[:1]),
+            bookings_bus=Subquery(bookings.values('bus')[:1]),
+            bookings_accomodation=Subquery(bookings.values('accomodation')[:1]),
+            bookings_sleeping_bag=Subquery(bookings.values('sleeping_bag')[:1]),
+        )
+        flags = {}
+        for field, condition in self.missing_info_conditions().items():
+            flags['missing_' + field] = ExpressionWrapper(condition, output_field=BooleanField())
+        return assigments.annotate(**flags)
+
+    @staticmethod
+    def missing_info_conditions():
+        return {
+            'profile': Q(profile_id__isnull=True),
+            'chest': Q(profile_chest__isnull=True) | Q(profile_chest=0),
+            'waist': Q(profile_waist__isnull=True) | Q(profile_waist=0),
+            'gender': Q(profile_gender__isnull=True),
+            'bookings': Q(bookings_id__isnull=True),
+            'bus': Q(bookings_bus__isnull=True),
+            'accomodation': Q(bookings_accomodation__isnull=True),
+            'sleeping_bag': Q(bookings_sleeping_bag__isnull=True),
+        }
+
+    # returns only the assigments with some missing information.
+    def with_missing_info_only(self):
+        incomplete = Q()
+        for condition in self.missing_info_conditions().values():
+            incomplete |= condition
+        return self.with_missing_info().filter(incomplete)
+
+    def for_group(self, group, run_id=None):
+        if not group.pk:
+            return self.none()
+        assigments = self.filter(character__group=group).for_run(run_id)
+        return assigments.with_related().order_by('character', 'id')
+
+    # annotates every assigment (once per uniform of its group) with the uniform and the size
+    # recommended to the player, matching the measurement ranges in the database with the same
+    # rules as Uniform.get_players_with_recommended_sizes: the first perfect fit or else the first
+    # valid fit, among the sizes of the player's gender and the unisex ones.
+    def with_uniform_size(self):
+        chest = OuterRef('user__playermeasurement__chest')
+        waist = OuterRef('user__playermeasurement__waist')
+        chest_fit = Q(chest_min__lte=chest, chest_max__gte=chest)
+        waist_fit = Q(waist_min__lte=waist, waist_max__gte=waist)
+
+        # one gender per player, like Uniform.get_player_gender: the one of the profile or else the
+        # first one set in the player's assigments of the group, so every run gets the same size.
+        assigments_gender = CharacterAssigment.objects.filter(
+            user=OuterRef('user'), character__group=OuterRef('character__group'), gender__isnull=False
+        ).order_by('character', 'id').values('gender')[:1]
+        assigments = self.annotate(player_gender=Coalesce('user__playermeasurement__gender', Subquery(assigments_gender)))
+
+        gender_sizes = UniformSize.objects.filter(uniform=OuterRef('uniform'), gender=OuterRef(OuterRef('player_gender')))
+        same_gender = (Q(gender=OuterRef('player_gender')) | Q(gender__isnull=True) | Q(gender__name="unisex") |
+                       Q(gender_has_no_sizes=True))
+
+        sizes = UniformSize.objects.filter(uniform=OuterRef('character__group__uniform')).annotate(
+            chest_top=Greatest('chest_min', 'chest_max'),
+            waist_top=Greatest('waist_min', 'waist_max'),
+            gender_has_no_sizes=~Exists(gender_sizes.exclude(gender__name="unisex")),
+        ).filter(same_gender).order_by('id')
+        perfect_fit = sizes.filter(chest_fit & waist_fit)
+        valid_fit = sizes.filter((chest_fit & Q(waist_top__gte=waist)) | (Q(chest_top__gte=chest) & waist_fit))
+
+        return assigments.annotate(
+            uniform=models.F('character__group__uniform'),
+            uniform_size=Coalesce(Subquery(perfect_fit.values('id')[:1]), Subquery(valid_fit.values('id')[:1])),
+        )
+
+
 class CharacterAssigment(models.Model):
     run = models.IntegerField(default=1)
     character = models.ForeignKey(Character, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
     gender = models.ForeignKey(Gender, on_delete=models.SET_NULL, null=True, blank=True)
     discord_email = models.CharField(max_length=500, null=True, blank=True)
+    # larp of the character's group, stored to filter the assigments of a larp without joins (signals.py).
+    larp = models.ForeignKey(Larp, on_delete=models.SET_NULL, null=True, blank=True)
+
+    objects = CharacterAssigmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'run'], name='assigment_user_run_idx'),
+            models.Index(fields=['larp', 'run'], name='assigment_larp_run_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['character', 'run'], name='unique_character_run'),
+        ]
 
     def __str__(self):
         assigment = ""
-        if self.character.group:
-            assigment = self.character.group.larp.name + " run " + str(self.run) + " - " + self.character.name
+        larp = self.larp
+        # assigments not saved yet have no larp, it is the one of the character's group.
+        if not larp and self.character.group:
+            larp = self.character.group.larp
+        if larp:
+            assigment = larp.name + " run " + str(self.run) + " - " + self.character.name
         if self.user:
             assigment += " assigned to " + self.user.first_name + " " + self.user.last_name
         return assigment
@@ -239,33 +402,15 @@ class CharacterAssigment(models.Model):
             result = assigment.user.username
         return result
 
-    def larp(self):
-        return self.character.group.larp
-
-    def create_player_profile(self):
-        player_profile = PlayerMeasurement(user=self.user)
-        player_profile.save()
-        return player_profile
-
     def get_player_profile(self):
         if not self.user:
             return None
-        player_profiles = PlayerMeasurement.objects.filter(user=self.user)
-        if player_profiles:
-            return player_profiles[0]
-        else:
-            return self.create_player_profile()
+        return PlayerMeasurement.objects.get_or_insert(user=self.user)
 
     def get_bookings(self):
-        larp = self.character.group.larp
-        booking = None
-        booking_search = Bookings.objects.filter(user=self.user, larp=larp, run=self.run)
-        if booking_search:
-            booking = booking_search[0]
-        elif self.user:
-            booking = Bookings(user=self.user, larp=larp, run=self.run)
-            booking.save()
-        return booking
+        if not self.user or not self.larp_id:
+            return None
+        return Bookings.objects.get_or_insert(user=self.user, larp=self.larp, run=self.run)
 
 
 # BOOKINGS
@@ -295,6 +440,13 @@ class Bookings(models.Model):
     sleeping_bag = models.BooleanField(null=True, blank=True)
     comments = models.CharField(max_length=500, default="no", blank=True, null=True)
 
+    objects = GetOrInsertManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'larp', 'run'], name='unique_bookings_user_larp_run'),
+        ]
+
     def __str__(self):
         text = ""
         if self.larp:
@@ -319,19 +471,47 @@ class Bookings(models.Model):
         self.save()
 
     def get_character(self):
-        assigments_search = CharacterAssigment.objects.filter(user=self.user, run=self.run)
-        for assigment in assigments_search:
-            if assigment.character.group.larp == self.larp:
-                return assigment.character
+        assigment = CharacterAssigment.objects.filter(user=self.user, run=self.run, larp=self.larp).select_related(
+            'character').order_by('id').first()
+        if assigment:
+            return assigment.character
         return None
 
 
 # UNIFORMS
 
+class UniformQuerySet(models.QuerySet):
+
+    # returns, for every uniform, how many players need each size (and how many fit none).
+    # The sizes are matched in a single query (CharacterAssigment.objects.with_uniform_size).
+    def procurement_report(self):
+        uniforms = list(self.select_related('group').order_by('id'))
+        quantities = CharacterAssigment.objects.exclude(user=None).with_uniform_size().filter(
+            uniform__in=[uniform.id for uniform in uniforms]).values('uniform', 'uniform_size').annotate(
+            quantity=Count('user', distinct=True)).order_by()
+        quantities = {(row['uniform'], row['uniform_size']): row['quantity'] for row in quantities}
+
+        sizes = {}
+        for size in UniformSize.objects.filter(uniform__in=uniforms).select_related('gender').order_by('id'):
+            sizes.setdefault(size.uniform_id, []).append(size)
+
+        report = []
+        for uniform in uniforms:
+            sizes_with_quantities = []
+            for size in sizes.get(uniform.id, []):
+                sizes_with_quantities.append({ "name": size.get_name(), "gender": size.gender, "info": size,
+                                               "quantity": quantities.get((uniform.id, size.id), 0) })
+            report.append({ "uniform": uniform, "sizes": sizes_with_quantities,
+                            "without_size": quantities.get((uniform.id, None), 0) })
+        return report
+
+
 class Uniform(models.Model):
     name = models.CharField(max_length=500)
     group = models.ForeignKey(Group, on_delete=models.SET_NULL, null=True)
 
+    objects = UniformQuerySet.as_manager()
+
     def __str__(self):
         text = self.name + " - "
         if self.group:
@@ -341,7 +521,7 @@ class Uniform(models.Model):
         return text
 
     def get_sizes(self):
-        return UniformSize.objects.filter(uniform=self)
+        return UniformSize.objects.filter(uniform=self).select_related('gender').order_by('id')
 
     def add_size(self, size_information):
         size = UniformSize(uniform=self)
@@ -368,40 +548,99 @@ class Uniform(models.Model):
         else:
             return None
 
-    def recommend_sizes(self, player):
-        sizes = self.get_sizes() #.filter(gender=player.gender)
-        # TODO: Associate size to Character Assigment gender.
-        if not sizes:
-            return None
-        perfect_fit = self.find_perfect_fit(sizes, player.chest, player.waist)
-        if perfect_fit:
-            return perfect_fit
-        return self.find_valid_fit(sizes, player.chest, player.waist)
+    def get_size_index(self):
+        return SizeIndex(self.get_sizes())
+
+    def get_size_partitions(self):
+        return SizePartitions(self.get_sizes())
+
+    def recommend_sizes(self, player, size_index=None):
+        if size_index is None:
+            size_index = self.get_size_partitions().get(player.gender_id)
+        return size_index.recommend(player.chest, player.waist)
+
+    # the gender of the player profile or, if it is not set, of one of the player's characters.
+    @staticmethod
+    def get_player_gender(player, character_assigments):
+        if player.gender_id:
+            return player.gender_id
+        for assigment in character_assigments:
+            if assigment.gender_id:
+                return assigment.gender_id
+        return None
 
     def get_players_with_recommended_sizes(self):
-        players_profiles = self.group.get_player_profiles()
+        character_assigments = self.group.get_character_assigments()
+        players_profiles = self.group.get_player_profiles(character_assigments)
+        assigments_by_user = self.group.get_assigments_by_user(character_assigments)
+        recommendations = RecommendationCache(self)
+        partitions = recommendations.get_size_partitions()
+
+        # players are matched only against the sizes of their gender.
+        players_by_gender = {}
         players_with_sizes = []
         for player in players_profiles:
-            sizes = self.recommend_sizes(player=player)
-            character_assigments = self.group.character_assigment_for_user(player.user)
-            players_with_sizes.append( { "info": player, "sizes": sizes, "character_assigments": character_assigments } )
+            character_assigments = assigments_by_user.get(player.user_id, [])
+            gender_id = partitions.get_gender(self.get_player_gender(player, character_assigments))
+            players_by_gender.setdefault(gender_id, []).append(len(players_with_sizes))
+            players_with_sizes.append( { "info": player, "character_assigments": character_assigments } )
+
+        for gender_id, positions in players_by_gender.items():
+            size_index = partitions.get(gender_id)
+            players = [players_with_sizes[position]["info"] for position in positions]
+            measurements = [(player.chest, player.waist) for player in players]
+            recommended_sizes = recommendations.recommend_batch(size_index, measurements, gender_id)
+            rankings = recommendations.rank_batch(size_index, [get_measurements(player) for player in players], gender_id)
+            for position, player, sizes, ranking in zip(positions, players, recommended_sizes, rankings):
+                closest_sizes = None
+                if not sizes and size_index.sizes and ranking:
+                    closest_sizes = size_index.nearest(player.chest, player.waist)
+                players_with_sizes[position]["sizes"] = sizes
+                players_with_sizes[position]["closest_sizes"] = closest_sizes
+                players_with_sizes[position]["best_fit"] = ranking[0] if ranking else None
+                players_with_sizes[position]["ranking"] = ranking
         return players_with_sizes
 
-    def increment_quantity(self, sizes_with_quantities, size_to_increment):
-        for size in sizes_with_quantities:
-            if size["name"] == size_to_increment:
-                size["quantity"] += 1
+    # gives every player of the group a garment of the stock (quantities by size id), as close as
+    # possible to their measurements and only of the sizes of their gender. Returns the players
+    # with their "allocated_size", the ones left without a garment and the stock left.
+    def allocate_sizes(self, stock):
+        players_with_sizes = self.get_players_with_recommended_sizes()
+        sizes = RecommendationCache(self).get_sizes()
+        positions = {size.id: position for position, size in enumerate(sizes)}
+        costs = []
+        for player in players_with_sizes:
+            costs.append({positions[size.id]: distance for size, distance in player["ranking"]})
+        allocation = StockAllocation(costs, [stock.get(size.id, 0) for size in sizes]).solve()
+
+        unallocated = []
+        remaining_stock = Counter({size.id: stock.get(size.id, 0) for size in sizes})
+        for player, position in zip(players_with_sizes, allocation):
+            if position is None:
+                player["allocated_size"] = None
+                unallocated.append(player)
+            else:
+                player["allocated_size"] = sizes[position]
+                remaining_stock[sizes[position].id] -= 1
+        return { "players": players_with_sizes, "unallocated": unallocated, "remaining_stock": remaining_stock }
 
-    def update_quantities(self, sizes_with_quantities, players_with_sizes):
+    # counts how many players have each size (by size id) as their first recommendation.
+    def count_sizes(self, players_with_sizes):
+        quantities = Counter()
         for player in players_with_sizes:
             if player["sizes"]:
-                player_size = player["sizes"][0].get_name()
-                self.increment_quantity(sizes_with_quantities, player_size)
+                quantities[player["sizes"][0].id] += 1
+        return quantities
+
+    def update_quantities(self, sizes_with_quantities, players_with_sizes):
+        quantities = self.count_sizes(players_with_sizes)
+        for size in sizes_with_quantities:
+            size["quantity"] = quantities[size["info"].id]
 
     def initialize_sizes_with_quantities(self):
         sizes_with_quantities = []
-        for size in self.get_sizes():
-            sizes_with_quantities.append({ "name": size.get_name(), "info": size, "quantity": 0 })
+        for size in RecommendationCache(self).get_sizes():
+            sizes_with_quantities.append({ "name": size.get_name(), "gender": size.gender, "info": size, "quantity": 0 })
         return sizes_with_quantities
 
     def get_sizes_with_quantities(self, players_with_sizes):
@@ -419,6 +658,21 @@ class UniformSize(models.Model):
     chest_max = models.IntegerField()
     waist_min = models.IntegerField()
     waist_max = models.IntegerField()
+    arm_min = models.IntegerField(default=0)
+    arm_max = models.IntegerField(default=0)
+    shoulder_min = models.IntegerField(default=0)
+    shoulder_max = models.IntegerField(default=0)
+    torso_min = models.IntegerField(default=0)
+    torso_max = models.IntegerField(default=0)
+    body_min = models.IntegerField(default=0)
+    body_max = models.IntegerField(default=0)
+
+    class Meta:
+        # the sizes of a uniform read through this index come grouped by gender: queries that
+        # depend on their order (Uniform.get_sizes) sort them by id.
+        indexes = [
+            models.Index(fields=['uniform', 'gender'], name='uniformsize_uniform_gender_idx'),
+        ]
 
     def __str__(self):
         text = self.uniform.name + " "
@@ -443,7 +697,7 @@ class UniformSize(models.Model):
         return name
 
     def get_measurement(self, size_info, index):
-        measurement = size_info[index]
+        measurement = size_info.get(index)
         if not measurement:
             return 0
         return int(measurement)
@@ -459,6 +713,14 @@ class UniformSize(models.Model):
         self.chest_max = self.get_measurement(size_info, "chest_max")
         self.waist_min = self.get_measurement(size_info, "waist_min")
         self.waist_max = self.get_measurement(size_info, "waist_max")
+        self.arm_min = self.get_measurement(size_info, "arm_min")
+        self.arm_max = self.get_measurement(size_info, "arm_max")
+        self.shoulder_min = self.get_measurement(size_info, "shoulder_min")
+        self.shoulder_max = self.get_measurement(size_info, "shoulder_max")
+        self.torso_min = self.get_measurement(size_info, "torso_min")
+        self.torso_max = self.get_measurement(size_info, "torso_max")
+        self.body_min = self.get_measurement(size_info, "body_min")
+        self.body_max = self.get_measurement(size_info, "body_max")
 
     def perfect_fit(self, chest, waist):
         return self.chest_fit(chest) and self.waist_fit(waist)
@@ -474,3 +736,145 @@ class UniformSize(models.Model):
 
     def waist_minimum_fit(self, waist):
         return self.waist_fit(waist) or self.waist_min >= waist
+
+
+# CSV IMPORT JOBS
+
+# cache (settings.CACHES) with the progress of the running import jobs.
+IMPORT_PROGRESS_CACHE = 'import_progress'
+# seconds without progress after which a running job is considered stopped (its worker died).
+IMPORT_JOB_TIMEOUT = 10 * 60
+# times a job is started before it is marked as failed.
+IMPORT_JOB_ATTEMPTS = 3
+
+
+class ImportFilesStorage(FileSystemStorage):
+    """Uploaded CSV files waiting to be imported, stored in settings.IMPORT_FILES_ROOT.
+
+    They have the emails of the players, so they are kept out of the project folder (MEDIA_ROOT
+    is not used) and deleted when their import finishes.
+    """
+
+    @property
+    def base_location(self):
+        return settings.IMPORT_FILES_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+class ImportJobQuerySet(models.QuerySet):
+
+    # marks the oldest pending job as running and returns it (None if there is none). The job is
+    # only taken if it is still pending, so several workers never run the same one.
+    def claim_next(self):
+        while True:
+            job = self.filter(status=ImportJob.PENDING).order_by('id').first()
+            if not job:
+                return None
+            claimed = self.filter(id=job.id, status=ImportJob.PENDING).update(
+                status=ImportJob.RUNNING, started=timezone.now(), attempts=models.F('attempts') + 1)
+            if claimed:
+                job.refresh_from_db()
+                return job
+
+    # puts the running jobs without progress for IMPORT_JOB_TIMEOUT back in the queue, or marks them
+    # as failed after IMPORT_JOB_ATTEMPTS. Their import transaction was rolled back with their worker.
+    def requeue_stale(self):
+        now = timezone.now()
+        for job in self.filter(status=ImportJob.RUNNING):
+            if not job.is_stale(now):
+                continue
+            if job.attempts >= IMPORT_JOB_ATTEMPTS:
+                job.rows_processed, job.errors, job.result = 0, 0, ""
+                job.finish(ImportJob.FAILED, "Nothing was imported: the import stopped " + str(job.attempts) + " times")
+            else:
+                self.filter(id=job.id, status=ImportJob.RUNNING, started=job.started).update(status=ImportJob.PENDING)
+
+
+class ImportJob(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    file = models.FileField(upload_to='csv_imports/', storage=ImportFilesStorage())
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    rows_processed = models.IntegerField(default=0)
+    errors = models.IntegerField(default=0)
+    result = models.TextField(blank=True, default="")
+    error_message = models.TextField(blank=True, default="")
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(default=0)
+
+    objects = ImportJobQuerySet.as_manager()
+
+    def __str__(self):
+        return self.file.name + " - " + self.status
+
+    # the progress of a running job is not saved in its row: the import transaction would hide it
+    # until the end. It is kept in a cache shared by the worker and the web server instead.
+    def get_progress_key(self):
+        return "import_job_%s_%s" % (self.id, self.started.timestamp() if self.started else "")
+
+    # adds the results of a batch of rows (called by the importer inside the import transaction).
+    def save_progress(self, results, errors):
+        self.rows_processed += len(results)
+        self.errors += errors
+        self.result += "".join(result + "\n" for result in results)
+        caches[IMPORT_PROGRESS_CACHE].set(self.get_progress_key(), {"rows_processed": self.rows_processed,
+                                          "errors": self.errors, "updated": timezone.now()})
+
+    # reads the progress saved by the worker while the job is running.
+    def load_progress(self):
+        if self.status == ImportJob.RUNNING:
+            progress = caches[IMPORT_PROGRESS_CACHE].get(self.get_progress_key(), {})
+            self.rows_processed = progress.get("rows_processed", self.rows_processed)
+            self.errors = progress.get("errors", self.errors)
+
+    # a running job whose worker has not reported any progress for IMPORT_JOB_TIMEOUT.
+    def is_stale(self, now):
+        progress = caches[IMPORT_PROGRESS_CACHE].get(self.get_progress_key(), {})
+        last_activity = progress.get("updated", self.started)
+        return (now - last_activity).total_seconds() > IMPORT_JOB_TIMEOUT
+
+    def finish(self, status, error_message=""):
+        self.status = status
+        self.error_message = error_message
+        self.finished = timezone.now()
+        self.save(update_fields=['status', 'rows_processed', 'errors', 'result', 'error_message', 'finished'])
+        caches[IMPORT_PROGRESS_CACHE].delete(self.get_progress_key())
+        # the name of the file is kept to show it on the upload page.
+        self.file.storage.delete(self.file.name)
+
+    def is_finished(self):
+        return self.status in [ImportJob.DONE, ImportJob.FAILED]
+
+    # rows processed per second since the job started.
+    def get_throughput(self):
+        if not self.started:
+            return 0
+        seconds = ((self.finished or timezone.now()) - self.started).total_seconds()
+        if seconds <= 0:
+            return 0
+        return self.rows_processed / seconds
+
+    # returns the progress of the job for the upload page, with the results once it has finished.
+    def get_progress(self):
+        self.load_progress()
+        progress = {
+            "id": self.id,
+            "status": self.status,
+            "rows_processed": self.rows_processed,
+            "errors": self.errors,
+            "throughput": round(self.get_throughput(), 1),
+            "error_message": self.error_message,
+            "finished": self.is_finished(),
+        }
+        if self.is_finished():
+            progress["result"] = self.result.splitlines()
+        return progress
@@ -0,0 +1,43 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import Character, CharacterAssigment, Group, Uniform, UniformSize
+from .uniform_fit import invalidate_sizes
+
+
+# UNIFORMS: drop the cached size recommendations when the size table changes
+
+@receiver([post_save, post_delete], sender=Uniform)
+def uniform_changed(sender, instance, **kwargs):
+    invalidate_sizes(instance.id)
+
+@receiver([post_save, post_delete], sender=UniformSize)
+def uniform_size_changed(sender, instance, **kwargs):
+    invalidate_sizes(instance.uniform_id)
+
+
+# CHARACTER ASSIGMENTS: keep their larp equal to the larp of the character's group
+
+def get_larp_id(character):
+    if character.group_id:
+        return character.group.larp_id
+    return None
+
+@receiver(pre_save, sender=CharacterAssigment)
+def assigment_saved(sender, instance, **kwargs):
+    instance.larp_id = get_larp_id(instance.character)
+
+# new characters and groups have no assigments yet.
+@receiver(post_save, sender=Character)
+def character_saved(sender, instance, created, **kwargs):
+    if not created:
+        CharacterAssigment.objects.filter(character=instance).update(larp=get_larp_id(instance))
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if not created:
+        CharacterAssigment.objects.filter(character__group=instance).update(larp=instance.larp_id)
+
+# the characters of a deleted group are left without group (and without larp).
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    CharacterAssigment.objects.filter(character__group=None).exclude(larp=None).update(larp=None)
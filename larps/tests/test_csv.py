@@ -1,7 +1,11 @@
+import io
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 from django.contrib.auth.models import User
 from config import csv_file_types, uniforms_header, characters_header
-from larps.models import Character
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from larps.models import Character, CharacterAssigment, CharacterType, Group, Larp, Race
 from larps.csv_importer import *
 from .examples import *
 
@@ -113,6 +117,18 @@ class CSVCharactersTests(TestCase):
         result = assign_character_to_user(user, character, run)
         self.assertEqual(result, "Character Ono assigned to Ana ")
 
+    def test_assign_character_to_another_user(self):
+        run = 2
+        character = Character(name="Ono")
+        character.save()
+        first_user = User.objects.create(username="Ana", first_name="Ana")
+        second_user = User.objects.create(username="Pepa", first_name="Pepa")
+        assign_character_to_user(first_user, character, run)
+        self.assertEqual(assign_character_to_user(first_user, character, run), "Not assigned.")
+        result = assign_character_to_user(second_user, character, run)
+        self.assertEqual(result, "Character Ono assigned to Pepa ")
+        self.assertEqual([assigment.user for assigment in CharacterAssigment.objects.all()], [second_user])
+
 
     # Test for processing lines
 
@@ -190,6 +206,186 @@ class CSVCharactersTests(TestCase):
 
 # CSV IMPORT UNIFORMS
 
+class ImportSessionTests(TestCase):
+
+    def test_tables_are_read_once(self):
+        session = ImportSession()
+        group = session.get_group("pilots", "Mission Together")
+        session.get_race("Rhea")
+        session.get_character_type("player")
+        with self.assertNumQueries(0):
+            self.assertEqual(session.get_group("pilots", "Mission Together"), group)
+            self.assertEqual(session.get_larp("Mission Together"), group.larp)
+            self.assertIs(session.get_group("", "Mission Together"), None)
+            session.get_race("Rhea")
+            session.get_character_type("player")
+
+    def test_existing_rows(self):
+        larp = Larp.objects.create(name="Mission Together")
+        group = Group.objects.create(name="pilots", larp=larp)
+        session = ImportSession()
+        self.assertEqual(session.get_group("pilots", "Mission Together"), group)
+        self.assertEqual(Larp.objects.count(), 1)
+        self.assertEqual(Group.objects.count(), 1)
+
+    def test_process_rows_with_session(self):
+        session = ImportSession()
+        process_character_info(bulk_characters_csv[0], session)
+        with self.assertNumQueries(0):
+            session.get_group(bulk_characters_csv[0][5], bulk_characters_csv[0][0])
+        with self.assertNumQueries(1):
+            session.get_group(bulk_characters_csv[1][5], bulk_characters_csv[1][0])
+        self.assertEqual(Group.objects.count(), 2)
+
+    def test_lookups_without_session(self):
+        larp = Larp.objects.create(name="Mission Together")
+        group = Group.objects.create(name="pilots", larp=larp)
+        Larp.objects.bulk_create([Larp(name="Larp " + str(i)) for i in range(0, 50)])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get_group("pilots", "Mission Together"), group)
+        self.assertEqual(len(queries), 2)
+        self.assertTrue(all("WHERE" in query["sql"] for query in queries.captured_queries))
+
+# CSV BULK IMPORT OF CHARACTERS
+
+bulk_characters_csv = [
+    ['Mission Together', '1', 'ana@email.com', 'Ana Garcia', 'Ono', 'agriculture teacher', 'Rhea', 'sargeant', 'secret NPC', '', '', ''],
+    ['Mission Together', '1', 'pepa@email.com', 'Pepa Perez', 'Fuertes', 'artist teacher', 'Kepler', '', 'player', '', '', ''],
+    ['Mission Together', '2', 'ana2@email.com', 'Ana Garcia', 'Fuertes', 'artist teacher', 'Kepler', '', 'player', '', '', ''],
+    ['Mission Together', '1', 'ana@email.com', 'Ana Garcia', 'Ono', 'agriculture teacher', 'Rhea', 'sargeant', 'secret NPC', '', '', ''],
+    ['Mission Together', '1', 'werner@email.com', 'Werner Mikolasch', 'Ono', 'agriculture teacher', 'Rhea', 'sargeant', 'secret NPC', '', '', ''],
+    ['Another Larp', '1', 'werner@email.com', 'Werner Mikolasch', 'Ono', 'pilots', 'Rhea', '', 'player', '', '', ''],
+    ['', '1', '', 'Samuel Bascomb', 'Lone', '', '', '', '', '', '', ''],
+    ['Mission Together', '1', '', '', 'Ono', 'agriculture teacher', 'Rhea', 'sargeant', 'secret NPC', '', '', ''],
+    ['Mission Together', '1', '', 'Fabio', '', '', '', '', '', '', '', ''],
+]
+
+class CSVBulkCharactersTests(TestCase):
+
+    def get_state(self):
+        users = sorted(User.objects.values_list('username', 'first_name', 'last_name', 'email'))
+        assigments = sorted((str(a), a.larp_id is not None) for a in CharacterAssigment.objects.all())
+        counts = [model.objects.count() for model in [Larp, Group, Race, CharacterType, Character]]
+        return users, assigments, counts
+
+    # runs the import inside a transaction that is rolled back, returning its results and the database state.
+    def run_import(self, import_function):
+        with transaction.atomic():
+            results = import_function()
+            state = self.get_state()
+            transaction.set_rollback(True)
+        return results, state
+
+    def test_same_results_as_row_by_row(self):
+        User.objects.create(username="Werner_Mikolasch", first_name="Old", email="old@email.com")
+        character = create_character('Mission Together', 'Fuertes', 'artist teacher', 'Kepler', '', 'player', '', '', '')
+        assign_character_to_user(User.objects.create(username="Other"), character, 2)
+
+        expected = self.run_import(lambda: [process_character_info(column) for column in bulk_characters_csv])
+        self.assertEqual(self.run_import(lambda: import_characters(bulk_characters_csv)), expected)
+        self.assertEqual(expected[0][:5], ['Character Ono assigned to Ana Garcia', 'Character Fuertes assigned to Pepa Perez',
+                                           'Character Fuertes assigned to Ana Garcia', 'Not assigned.',
+                                           'Character Ono assigned to Werner Mikolasch'])
+
+    def test_queries_do_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as one_file:
+            self.run_import(lambda: import_characters(bulk_characters_csv))
+        with CaptureQueriesContext(connection) as bigger_file:
+            self.run_import(lambda: import_characters(bulk_characters_csv * 20))
+        self.assertEqual(len(bigger_file), len(one_file))
+
+# CSV DRY RUN
+
+class CSVDryRunTests(TestCase):
+    get_state = CSVBulkCharactersTests.get_state
+    run_import = CSVBulkCharactersTests.run_import
+
+    def setUp(self):
+        User.objects.create(username="Werner_Mikolasch", first_name="Old", email="old@email.com")
+        character = create_character('Mission Together', 'Fuertes', 'artist teacher', 'Kepler', '', 'player', '', '', '')
+        assign_character_to_user(User.objects.create(username="Other"), character, 2)
+
+    def test_diff(self):
+        diff = preview_import_characters(bulk_characters_csv)
+        self.assertEqual([user.username for user in diff["new_users"]], ["Ana_Garcia", "Pepa_Perez", "Samuel_Bascomb", "Fabio"])
+        self.assertEqual([(character.name, character.group.name if character.group else None) for character in diff["new_characters"]],
+                         [("Ono", "agriculture teacher"), ("Ono", "pilots"), ("Lone", None)])
+        self.assertEqual([(change["character"].name, change["run"], change["user"].username) for change in diff["assigned"]],
+                         [("Ono", 1, "Ana_Garcia"), ("Fuertes", 1, "Pepa_Perez"), ("Ono", 1, "Werner_Mikolasch"), ("Lone", 1, "Samuel_Bascomb")])
+        self.assertEqual([(change["character"].name, change["run"], change["previous_user"].username, change["user"].username)
+                          for change in diff["reassigned"]],
+                         [("Fuertes", 2, "Other", "Ana_Garcia"), ("Ono", 1, "Ana_Garcia", "Werner_Mikolasch")])
+        self.assertEqual(diff["invalid"], [{"line": 9, "result": "User invalid"},
+                                           {"line": 10, "result": "Created user Fabio . Character invalid"}])
+
+    def test_same_changes_as_import(self):
+        users, assigments, counts = self.get_state()
+        results, (new_users, new_assigments, new_counts) = self.run_import(lambda: import_characters(bulk_characters_csv))
+        diff = preview_import_characters(bulk_characters_csv)
+        self.assertEqual(len(diff["new_users"]), len(new_users) - len(users))
+        self.assertEqual(len(diff["new_characters"]), new_counts[-1] - counts[-1])
+        self.assertEqual(len(diff["assigned"]) + len(diff["reassigned"]), len([result for result in results if "assigned to" in result]))
+        self.assertEqual(len(diff["invalid"]), len([result for result in results if is_error_result(result)]))
+
+    def test_nothing_is_written(self):
+        state = self.get_state()
+        with CaptureQueriesContext(connection) as one_file:
+            preview_import_characters(bulk_characters_csv)
+        with CaptureQueriesContext(connection) as bigger_file:
+            preview_import_characters(bulk_characters_csv * 20)
+        self.assertEqual(self.get_state(), state)
+        self.assertEqual(len(bigger_file), len(one_file))
+        self.assertTrue(all(query["sql"].startswith("SELECT") for query in bigger_file.captured_queries))
+
+    def test_rows_that_can_not_be_read(self):
+        columns = [bulk_characters_csv[0], ['Mission Together', 'one'] + bulk_characters_csv[1][2:], ['Mission Together', '1', ''], []]
+        diff = preview_import_characters(columns)
+        self.assertEqual(len(diff["assigned"]), 1)
+        self.assertEqual(diff["invalid"], [{"line": 3, "result": "Invalid run: one"},
+                                           {"line": 4, "result": "Incomplete row: 3 of 12 columns"},
+                                           {"line": 5, "result": "Incomplete row: 0 of 12 columns"}])
+
+    def test_preview_csv(self):
+        diff = preview_csv(uploaded_file(characters_csv_example, 10))
+        self.assertEqual([user.username for user in diff["new_users"]], ["Fabio"])
+        self.assertEqual(preview_csv(uploaded_file(incorrect_csv, 10)), {"error": "Incorrect file type"})
+        self.assertEqual(preview_csv(uploaded_file(uniforms_csv_example, 10)),
+                         {"error": "The dry run is only available for characters files"})
+
+# CSV STREAMING
+
+def uploaded_file(text, chunk_size):
+    file = SimpleUploadedFile("characters.csv", text.encode('UTF-8'))
+    file.DEFAULT_CHUNK_SIZE = chunk_size
+    return file
+
+class CSVStreamingTests(TestCase):
+
+    def test_same_lines_as_whole_file(self):
+        text = characters_csv_example.replace("Fabio", "Fabio Muñoz").replace("\n", "\r\n") + "\nLast;ñ"
+        for chunk_size in [1, 2, 3, 7, 1000]:
+            lines = list(read_csv_lines(uploaded_file(text, chunk_size)))
+            self.assertEqual(lines, list(io.StringIO(text)))
+
+    def test_process_csv(self):
+        result = process_csv(uploaded_file(characters_csv_example, 10))
+        self.assertEqual(result, ['Character Ono assigned to Werner Mikolasch', 'Character Fuertes assigned to Fabio '])
+
+    def test_process_csv_with_on_batch(self):
+        batches = []
+        result = process_csv(uploaded_file(characters_csv_example, 10), on_batch=batches.append)
+        self.assertEqual(result, [])
+        self.assertEqual(batches, [['Character Ono assigned to Werner Mikolasch', 'Character Fuertes assigned to Fabio ']])
+        self.assertEqual(process_csv(uploaded_file("", 10), on_batch=batches.append), ["Incorrect file type"])
+
+    def test_empty_file(self):
+        self.assertEqual(process_csv(uploaded_file("", 10)), ["Incorrect file type"])
+
+    def test_batches(self):
+        self.assertEqual(list(get_batches(range(0, 5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(get_batches([], 2)), [])
+
+
 class CSVUniformsTests(TestCase):
     csv_type = csv_file_types()[1][0]
 
@@ -203,6 +399,15 @@ class CSVUniformsTests(TestCase):
         result = process_csv_line(column, self.csv_type)
         self.assertEqual(result, "Pilots - group not assigned - female. L/44 chest(98,102) waist(82,86)")
 
+    def test_process_csv_line_all_measurements(self):
+        column = ["Pilots","female","L",44,98,102,60,62,82,86,40,42,50,54,160,170]
+        process_csv_line(column, self.csv_type)
+        size = UniformSize.objects.get(american_size="L")
+        self.assertEqual((size.arm_min, size.arm_max), (60, 62))
+        self.assertEqual((size.shoulder_min, size.shoulder_max), (40, 42))
+        self.assertEqual((size.torso_min, size.torso_max), (50, 54))
+        self.assertEqual((size.body_min, size.body_max), (160, 170))
+
     def test_process_csv_line_no_group(self):
         column = incorrect_size_examples[1]
         result = process_csv_line(column, self.csv_type)
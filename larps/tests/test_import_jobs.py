@@ -0,0 +1,173 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from larps.csv_importer import run_import_job
+from larps.models import IMPORT_JOB_ATTEMPTS, IMPORT_JOB_TIMEOUT, CharacterAssigment, ImportJob
+from .examples import characters_csv_example, incorrect_csv
+
+IMPORT_FILES_ROOT = tempfile.mkdtemp()
+
+
+def create_job(data, name="characters.csv"):
+    job = ImportJob()
+    job.file.save(name, ContentFile(data.encode('UTF-8')))
+    return job
+
+
+@override_settings(IMPORT_FILES_ROOT=IMPORT_FILES_ROOT)
+class ImportJobTests(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(IMPORT_FILES_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_claim_next(self):
+        first_job = create_job(characters_csv_example)
+        create_job(characters_csv_example)
+        job = ImportJob.objects.claim_next()
+        self.assertEqual(job, first_job)
+        self.assertEqual(job.status, ImportJob.RUNNING)
+        self.assertIsNotNone(job.started)
+        self.assertNotEqual(ImportJob.objects.claim_next(), first_job)
+        self.assertIs(ImportJob.objects.claim_next(), None)
+
+    def test_run_import_job(self):
+        create_job(characters_csv_example)
+        job = run_import_job(ImportJob.objects.claim_next())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual(job.rows_processed, 2)
+        self.assertEqual(job.errors, 0)
+        self.assertEqual(job.get_progress()["result"], ['Character Ono assigned to Werner Mikolasch',
+                                                        'Character Fuertes assigned to Fabio '])
+        self.assertEqual(CharacterAssigment.objects.count(), 2)
+
+    def test_file_is_deleted_when_the_job_finishes(self):
+        job = create_job(characters_csv_example)
+        path = job.file.path
+        self.assertTrue(path.startswith(IMPORT_FILES_ROOT))
+        self.assertTrue(os.path.exists(path))
+        job = run_import_job(ImportJob.objects.claim_next())
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(job.file.name.startswith("csv_imports/characters"))
+
+    def test_run_import_job_incorrect_file(self):
+        create_job(incorrect_csv)
+        job = run_import_job(ImportJob.objects.claim_next())
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(job.error_message, "Incorrect file type")
+
+    def test_progress_is_reported_every_batch(self):
+        data = characters_csv_example + "\nMission Together;1;;;Lone;;;;;;;"
+        create_job(data)
+        job = ImportJob.objects.claim_next()
+        progress = []
+        save_progress = job.save_progress
+        def save_and_record(results, errors):
+            save_progress(results, errors)
+            # another process reads the job row and the progress cache.
+            job_progress = ImportJob.objects.get(id=job.id).get_progress()
+            progress.append((job_progress["rows_processed"], job_progress["errors"]))
+        job.save_progress = save_and_record
+        with mock.patch('larps.csv_importer.IMPORT_BATCH_SIZE', 2):
+            run_import_job(job)
+        self.assertEqual(progress, [(2, 0), (3, 1)])
+        self.assertEqual(ImportJob.objects.get(id=job.id).get_progress()["rows_processed"], 3)
+
+    def test_failed_job_imports_nothing(self):
+        create_job(characters_csv_example + "\nMission Together;two;test3@email.com;Lola Flores;Lone;pilots;;;;;;")
+        with mock.patch('larps.csv_importer.IMPORT_BATCH_SIZE', 2):
+            job = run_import_job(ImportJob.objects.claim_next())
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(job.error_message, "Nothing was imported: invalid literal for int() with base 10: 'two'")
+        self.assertFalse(CharacterAssigment.objects.exists())
+        self.assertFalse(User.objects.exists())
+
+    def test_requeue_stale_jobs(self):
+        create_job(characters_csv_example)
+        job = ImportJob.objects.claim_next()
+        ImportJob.objects.requeue_stale()
+        self.assertEqual(ImportJob.objects.get().status, ImportJob.RUNNING)
+        # the worker died an hour ago.
+        ImportJob.objects.update(started=timezone.now() - timedelta(hours=1))
+        ImportJob.objects.requeue_stale()
+        self.assertEqual(ImportJob.objects.get().status, ImportJob.PENDING)
+        job = run_import_job(ImportJob.objects.claim_next())
+        self.assertEqual(job.status, ImportJob.DONE)
+        self.assertEqual(job.attempts, 2)
+
+    def test_recent_progress_is_not_stale(self):
+        create_job(characters_csv_example)
+        job = ImportJob.objects.claim_next()
+        job.save_progress(["Not assigned."], 0)
+        later = timezone.now() + timedelta(seconds=IMPORT_JOB_TIMEOUT - 60)
+        self.assertFalse(job.is_stale(later))
+        self.assertTrue(job.is_stale(later + timedelta(seconds=120)))
+
+    def test_stale_job_fails_after_the_last_attempt(self):
+        create_job(characters_csv_example)
+        for _ in range(0, IMPORT_JOB_ATTEMPTS):
+            ImportJob.objects.claim_next()
+            ImportJob.objects.update(started=timezone.now() - timedelta(hours=1))
+            ImportJob.objects.requeue_stale()
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertEqual(job.error_message, "Nothing was imported: the import stopped 3 times")
+        self.assertIs(ImportJob.objects.claim_next(), None)
+
+    def test_management_command(self):
+        create_job(characters_csv_example)
+        call_command('run_import_jobs', '--once', stdout=StringIO())
+        self.assertEqual(ImportJob.objects.get().status, ImportJob.DONE)
+
+    def test_upload_and_progress_pages(self):
+        user = User.objects.create(username="admin", is_staff=True)
+        self.client.force_login(user)
+        file = ContentFile(characters_csv_example.encode('UTF-8'), name="characters.csv")
+        response = self.client.post(reverse('larps:file_upload'), {'file': file})
+        job = ImportJob.objects.get()
+        self.assertEqual(response.url, reverse('larps:file_upload') + "?job=" + str(job.id))
+        self.assertEqual(job.user, user)
+
+        response = self.client.get(reverse('larps:import_job_progress', args=[job.id]))
+        self.assertEqual(response.json()["status"], ImportJob.PENDING)
+        self.assertFalse(response.json()["finished"])
+        run_import_job(ImportJob.objects.claim_next())
+        response = self.client.get(reverse('larps:import_job_progress', args=[job.id]))
+        self.assertEqual(response.json()["rows_processed"], 2)
+        self.assertEqual(len(response.json()["result"]), 2)
+
+    def test_unknown_jobs(self):
+        self.client.force_login(User.objects.create(username="admin", is_staff=True))
+        response = self.client.get(reverse('larps:import_job_progress', args=[1]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('larps:file_upload') + "?job=abc")
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(response.context.get("job"), None)
+
+    def test_upload_dry_run(self):
+        self.client.force_login(User.objects.create(username="admin", is_staff=True))
+        file = ContentFile(characters_csv_example.encode('UTF-8'), name="characters.csv")
+        response = self.client.post(reverse('larps:file_upload'), {'file': file, 'dry_run': 'on'})
+        self.assertEqual(len(response.context["diff"]["assigned"]), 2)
+        self.assertContains(response, "Run 2: Fuertes to Fabio")
+        self.assertFalse(ImportJob.objects.exists())
+        self.assertFalse(CharacterAssigment.objects.exists())
+
+    def test_upload_dry_run_with_typos(self):
+        self.client.force_login(User.objects.create(username="admin", is_staff=True))
+        data = characters_csv_example.replace("Mission Together;2;", "Mission Together;two;") + "\nMission Together;1"
+        file = ContentFile(data.encode('UTF-8'), name="characters.csv")
+        response = self.client.post(reverse('larps:file_upload'), {'file': file, 'dry_run': 'on'})
+        self.assertContains(response, "Line 3: Invalid run: two")
+        self.assertContains(response, "Line 4: Incomplete row: 2 of 12 columns")
@@ -0,0 +1,30 @@
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase
+from larps.models import Bookings, CharacterAssigment, PlayerMeasurement, UniformSize
+
+
+# the query plans are checked with SQLite, the database used by the tests.
+@skipUnless(connection.vendor == 'sqlite', "query plans are only checked on SQLite")
+class IndexesTests(TestCase):
+
+    # checks that the query searches an index with all the filtered columns.
+    def assertUsesIndex(self, queryset, columns):
+        plan = queryset.explain()
+        self.assertIn("USING INDEX", plan)
+        self.assertIn("(" + " AND ".join(column + "=?" for column in columns) + ")", plan)
+
+    def test_character_assigments_by_user_and_run(self):
+        self.assertUsesIndex(CharacterAssigment.objects.filter(user=1, run=1), ["user_id", "run"])
+
+    def test_character_assigments_by_character_and_run(self):
+        self.assertUsesIndex(CharacterAssigment.objects.filter(character=1, run=1), ["character_id", "run"])
+
+    def test_bookings_by_user_larp_and_run(self):
+        self.assertUsesIndex(Bookings.objects.filter(user=1, larp=1, run=1), ["user_id", "larp_id", "run"])
+
+    def test_player_measurement_by_user(self):
+        self.assertUsesIndex(PlayerMeasurement.objects.filter(user=1), ["user_id"])
+
+    def test_uniform_sizes_by_uniform_and_gender(self):
+        self.assertUsesIndex(UniformSize.objects.filter(uniform=1, gender=1), ["uniform_id", "gender_id"])
@@ -0,0 +1,59 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MergeDuplicatesMigrationTests(TransactionTestCase):
+    migrate_from = [('larps', '0033_characterassigment_user_run_index')]
+    migrate_to = [('larps', '0034_merge_duplicates')]
+
+    # migrates the database back to migrate_from, where the duplicated rows can still be created.
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        self.latest = executor.loader.graph.leaf_nodes()
+        executor.migrate(self.migrate_from)
+        self.apps = executor.loader.project_state(self.migrate_from).apps
+
+    def tearDown(self):
+        MigrationExecutor(connection).migrate(self.latest)
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        return executor.loader.project_state(self.migrate_to).apps
+
+    def test_merge_bookings(self):
+        User = self.apps.get_model('auth', 'User')
+        Larp = self.apps.get_model('larps', 'Larp')
+        Bookings = self.apps.get_model('larps', 'Bookings')
+        user = User.objects.create(username="Ana")
+        larp = Larp.objects.create(name="Mission Together")
+        kept = Bookings.objects.create(user=user, larp=larp, run=1, sleeping_bag=False, comments="")
+        Bookings.objects.create(user=user, larp=larp, run=1, sleeping_bag=True, comments="vegan")
+        Bookings.objects.create(user=user, larp=larp, run=2, sleeping_bag=True)
+
+        Bookings = self.migrate().get_model('larps', 'Bookings')
+        self.assertEqual(list(Bookings.objects.filter(run=1).values_list('id', 'sleeping_bag', 'comments')),
+                         [(kept.id, False, "vegan")])
+        self.assertEqual(Bookings.objects.count(), 2)
+
+    def test_merge_profiles(self):
+        User = self.apps.get_model('auth', 'User')
+        PlayerMeasurement = self.apps.get_model('larps', 'PlayerMeasurement')
+        user = User.objects.create(username="Ana")
+        kept = PlayerMeasurement.objects.create(user=user, chest=90)
+        PlayerMeasurement.objects.create(user=user, chest=100, waist=70)
+
+        PlayerMeasurement = self.migrate().get_model('larps', 'PlayerMeasurement')
+        self.assertEqual(list(PlayerMeasurement.objects.values_list('id', 'chest', 'waist')), [(kept.id, 90, 70)])
+
+    def test_merge_character_assigments(self):
+        User = self.apps.get_model('auth', 'User')
+        Character = self.apps.get_model('larps', 'Character')
+        CharacterAssigment = self.apps.get_model('larps', 'CharacterAssigment')
+        character = Character.objects.create(name="Ono")
+        CharacterAssigment.objects.create(character=character, run=1, user=User.objects.create(username="Ana"))
+        last = CharacterAssigment.objects.create(character=character, run=1, user=User.objects.create(username="Pepa"))
+
+        CharacterAssigment = self.migrate().get_model('larps', 'CharacterAssigment')
+        self.assertEqual(list(CharacterAssigment.objects.values_list('id', 'user__username')), [(last.id, "Pepa")])
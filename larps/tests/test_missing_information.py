@@ -1,5 +1,5 @@
 from django.test import TestCase
-from larps.models import Larp, Bookings
+from larps.models import Larp, Bookings, PlayerMeasurement, Gender
 from .util_test import create_group, create_characters_assigments, create_character_assigment, set_bookings
 from .examples import example_players_complete, example_players_incomplete, example_bookings
 
@@ -7,93 +7,60 @@ from .examples import example_players_complete, example_players_incomplete, exam
 class MissingInformationTests(TestCase):
 
 
-    def test_get_players_information_empty(self):
+    def test_get_players_missing_information_empty(self):
         # Initialize
         larp = Larp(name="")
         # Get information
-        missing_info = larp.get_players_information()
+        missing_info = larp.get_players_missing_information()
         # Validate
-        self.assertIs(len(missing_info), 0)
+        self.assertEqual(missing_info, [])
 
 
-    def test_get_players_information_empty_one_run(self):
+    def test_get_players_missing_information_without_profile_and_bookings(self):
         # Initialize
         group = create_group()
         larp = group.larp
         player_info = example_players_incomplete[0]
-        assigment = create_character_assigment(group, player_info, run=1)
+        create_character_assigment(group, player_info, run=2)
         # Get information
-        missing_info = larp.get_players_information()
+        missing_info = larp.get_players_missing_information()
         # Validate
         self.assertIs(len(missing_info), 1)
-        self.assertIs(len(missing_info[0]), 1)
         missing_player_info = missing_info[0][0]
         self.assertEqual(missing_player_info["user"], player_info["first_name"]+" "+player_info["last_name"])
-        self.assertEqual(missing_player_info["profile"].user.username, player_info["username"])
-        self.assertEqual(missing_player_info["bookings"].bus, None)
-        self.assertEqual(missing_player_info["bookings"].accomodation, None)
-        self.assertEqual(missing_player_info["bookings"].sleeping_bag, None)
-        self.assertEqual(missing_player_info["run"], 1)
+        self.assertEqual(missing_player_info["run"], 2)
+        self.assertIs(missing_player_info["missing"]["profile"], True)
+        self.assertIs(missing_player_info["missing"]["bookings"], True)
+        self.assertEqual(PlayerMeasurement.objects.count(), 0)
+        self.assertEqual(Bookings.objects.count(), 0)
 
 
-    def test_get_players_information_with_profile_info(self):
-        # Initialize
-        group = create_group()
-        larp = group.larp
-        players_info = example_players_complete
-        create_characters_assigments(group, players=players_info)
-        # Get information
-        missing_info = larp.get_players_information()
-        # Validate
-        self.assertIs(len(missing_info), 1)
-        players_run1 = missing_info[0]
-        self.assertEqual(len(players_run1), len(players_info))
-        count = 0
-        for missing_player_info in players_run1:
-            self.assertEqual(missing_player_info["user"], players_info[count]["first_name"]+" "+players_info[count]["last_name"])
-            self.assertEqual(missing_player_info["profile"].user.username, players_info[count]["username"])
-            self.assertEqual(missing_player_info["bookings"].bus, None)
-            self.assertEqual(missing_player_info["bookings"].accomodation, None)
-            self.assertEqual(missing_player_info["bookings"].sleeping_bag, None)
-            self.assertEqual(missing_player_info["run"], 1)
-            count += 1
-
-
-    def test_get_missing_players_with_some_booking_info(self):
+    def test_get_players_missing_information_some_fields(self):
         # Initialize
         group = create_group()
         larp = group.larp
         player_info = example_players_complete[0]
-        bookings_info = example_bookings[0]
         assigment = create_character_assigment(group, player_info)
-        set_bookings(assigment, bookings_info)
+        set_bookings(assigment, example_bookings[0])
         # Get information
-        missing_info = larp.get_players_information()
+        missing_info = larp.get_players_missing_information()
         # Validate
-        self.assertIs(len(missing_info), 1)
-        missing_player_info = missing_info[0][0]
-        self.assertEqual(missing_player_info["user"], player_info["first_name"]+" "+player_info["last_name"])
-        self.assertEqual(missing_player_info["profile"].user.username, player_info["username"])
-        self.assertEqual(missing_player_info["bookings"].bus, None)
-        self.assertEqual(missing_player_info["bookings"].accomodation, None)
-        self.assertEqual(missing_player_info["bookings"].sleeping_bag, False)
+        missing = missing_info[0][0]["missing"]
+        self.assertEqual(missing, {"profile": False, "chest": False, "waist": False, "gender": True,
+                                   "bookings": False, "bus": True, "accomodation": True, "sleeping_bag": False})
 
 
-    def test_get_players_information_with_all_booking_info(self):
+    def test_get_players_missing_information_excludes_complete_players(self):
         # Initialize
         group = create_group()
         larp = group.larp
-        player_info = example_players_complete[0]
-        bookings_info = example_bookings[1]
-        assigment = create_character_assigment(group, player_info)
-        set_bookings(assigment, bookings_info)
+        assigments = create_characters_assigments(group, players=example_players_complete[:2])
+        gender = Gender.objects.create(name="female")
+        PlayerMeasurement.objects.filter(user=assigments[0].user).update(gender=gender)
+        set_bookings(assigments[0], example_bookings[1])
         # Get information
-        missing_info = larp.get_players_information()
+        with self.assertNumQueries(1):
+            missing_info = larp.get_players_missing_information(run_id=1)
         # Validate
         self.assertIs(len(missing_info), 1)
-        missing_player_info = missing_info[0][0]
-        self.assertEqual(missing_player_info["user"], player_info["first_name"]+" "+player_info["last_name"])
-        self.assertEqual(missing_player_info["profile"].user.username, player_info["username"])
-        self.assertEqual(missing_player_info["bookings"].bus.name, bookings_info["bus"])
-        self.assertEqual(missing_player_info["bookings"].accomodation.name, bookings_info["accomodation"])
-        self.assertEqual(missing_player_info["bookings"].sleeping_bag, True)
+        self.assertEqual([player["character"] for player in missing_info[0]], [assigments[1].character.name])
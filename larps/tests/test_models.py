@@ -35,6 +35,44 @@ class PlayerMeasurementModelTests(TestCase):
 
 # LARPS AND CHARACTERS
 
+class LarpModelTests(TestCase):
+
+    def test_get_character_assigments(self):
+        group = create_group(example_groups[0])
+        create_characters_assigments(group, players=example_players_complete, characters=example_characters)
+        with self.assertNumQueries(1):
+            assigments = group.larp.get_character_assigments()
+            names = [(a.user.username, a.character.name, a.larp.name) for a in assigments]
+        self.assertEqual(len(names), len(example_players_complete))
+        for i in range(0,len(example_players_complete)):
+            self.assertEqual(names[i], (example_players_complete[i]["username"], example_characters[i], larp_name))
+
+    def test_get_character_assigments_by_run(self):
+        group = create_group(example_groups[0])
+        create_characters_assigments(group, players=example_players_complete[:2], characters=example_characters1[:2], run=1)
+        create_characters_assigments(group, players=example_players_complete[2:], characters=example_characters2[:2], run=2)
+        assigments = group.larp.get_character_assigments(run_id=2)
+        self.assertEqual([a.character.name for a in assigments], example_characters2[:2])
+
+    def test_get_number_of_runs(self):
+        group = create_group(example_groups[0])
+        create_characters_assigments(group, players=example_players_complete[:2], characters=example_characters1[:2], run=1)
+        create_characters_assigments(group, players=example_players_complete[2:], characters=example_characters2[:2], run=3)
+        self.assertEqual(group.larp.get_number_of_runs(), 3)
+
+    def test_with_number_of_runs(self):
+        group = create_group(example_groups[0])
+        create_characters_assigments(group, players=example_players_complete[:2], characters=example_characters1[:2], run=2)
+        empty_larp = Larp.objects.create(name="Blue Flame")
+        with self.assertNumQueries(1):
+            runs = {larp.name: larp.number_of_runs for larp in Larp.objects.with_number_of_runs()}
+        self.assertEqual(runs, {larp_name: 2, empty_larp.name: 0})
+
+    def test_get_character_assigments_unsaved_larp(self):
+        larp = Larp(name=larp_name)
+        self.assertEqual(larp.get_character_assigments(), [])
+
+
 class GroupModelTests(TestCase):
 
     def test_create_group(self):
@@ -136,6 +174,31 @@ class GroupModelTests(TestCase):
         profiles = uniform.group.get_player_profiles()
         self.assertEqual(len(profiles), len(example_players_complete))
 
+    def test_get_player_profiles_number_of_queries(self):
+        group = create_group()
+        create_characters_assigments(group, players=example_players_complete, characters=example_characters[2:4])
+        create_characters_assigments(group, players=example_players_incomplete, characters=example_characters[:2])
+        character_assigments = group.get_character_assigments()
+        # profiles, insert of the missing ones and read of the inserted ones.
+        with self.assertNumQueries(3):
+            profiles = group.get_player_profiles(character_assigments)
+        self.assertTrue(all(profile.pk for profile in profiles))
+        with self.assertNumQueries(1):
+            self.assertEqual(group.get_player_profiles(character_assigments), profiles)
+
+    def test_character_assigment_for_user_player_in_2_runs(self):
+        player_repeated = example_players_complete[1]
+        uniform = create_uniform_with_player_in_several_runs(sizes=example_sizes, players_info=example_players_complete,
+                                                            characters_names=example_characters, player_in_several_runs=player_repeated,
+                                                            group_name=example_groups[0], runs=2)
+        group = uniform.group
+        assigments_by_user = group.get_assigments_by_user()
+        user = User.objects.get(username=player_repeated["username"])
+        with self.assertNumQueries(0):
+            assigments = group.character_assigment_for_user(user, assigments_by_user)
+        self.assertEqual([assigment.run for assigment in assigments], [1, 2])
+        self.assertEqual(group.character_assigment_for_user(user), assigments)
+
 
 class CharacterModelTests(TestCase):
 
@@ -200,6 +263,36 @@ class CharacterModelTests(TestCase):
 
 class CharacterAssigmentModelTests(TestCase):
 
+    def test_larp_of_the_character_group(self):
+        group = create_group()
+        assigment = create_character_assigment(group)
+        self.assertEqual(assigment.larp, group.larp)
+
+    def test_larp_follows_character_group(self):
+        assigment = create_character_assigment(create_group())
+        other_group = create_group(group_name="Marines", larp_name="Another Larp")
+        character = assigment.character
+        character.group = other_group
+        character.save()
+        assigment.refresh_from_db()
+        self.assertEqual(assigment.larp, other_group.larp)
+        character.group = None
+        character.save()
+        assigment.refresh_from_db()
+        self.assertIs(assigment.larp, None)
+
+    def test_larp_follows_group_larp(self):
+        group = create_group()
+        assigment = create_character_assigment(group)
+        other_larp = Larp.objects.create(name="Another Larp")
+        group.larp = other_larp
+        group.save()
+        assigment.refresh_from_db()
+        self.assertEqual(assigment.larp, other_larp)
+        group.delete()
+        assigment.refresh_from_db()
+        self.assertIs(assigment.larp, None)
+
     def test_create_booking(self):
         # initialize
         group = create_group()
@@ -218,4 +311,4 @@ class CharacterAssigmentModelTests(TestCase):
         self.assertIs(bookings.bus, None)
         self.assertIs(bookings.accomodation, None)
         self.assertIs(bookings.sleeping_bag, None)
-        self.assertIs(bookings.comments, "no")
+        self.assertEqual(bookings.comments, "no")
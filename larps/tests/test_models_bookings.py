@@ -69,3 +69,15 @@ class BookingsModelTests(TestCase):
         test_larp = Larp(name = "Blue Flame")
         test_bookings = Bookings(user=test_user, larp=test_larp, run=1)
         self.assertIs(test_bookings.comments,"no")
+
+    def test_get_or_insert_bookings(self):
+        user = User.objects.create(username="ana", first_name="Ana", last_name="Garcia")
+        larp = Larp.objects.create(name="Blue Flame")
+        bookings = Bookings.objects.get_or_insert(user=user, larp=larp, run=1)
+        bookings.comments = "vegetarian"
+        bookings.save()
+        with self.assertNumQueries(1):
+            same_bookings = Bookings.objects.get_or_insert(user=user, larp=larp, run=1)
+        self.assertEqual(same_bookings.id, bookings.id)
+        self.assertEqual(same_bookings.comments, "vegetarian")
+        self.assertEqual(Bookings.objects.count(), 1)
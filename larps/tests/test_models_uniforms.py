@@ -1,5 +1,6 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
+from larps.models import CharacterAssigment, Gender, PlayerMeasurement
 from .util_test import create_player
 from .util_test_uniforms import *
 from .examples import example_sizes, example_players_complete, example_sizes_info, empty_size_info
@@ -48,6 +49,12 @@ class UniformModelTests(TestCase):
         self.assertEqual(size.waist_max, 0)
         self.assertEqual(str(size), "unisex. chest(0,0) waist(0,0)")
 
+    def test_get_sizes_in_creation_order(self):
+        sizes = [dict(example_sizes[position], gender=gender) for position, gender in enumerate(["male", "female", "male", "female"])]
+        uniform = create_uniform_with_sizes(sizes)
+        self.assertEqual([size.gender.name for size in uniform.get_sizes()], ["male", "female", "male", "female"])
+        self.assertEqual([size.id for size in uniform.get_sizes()], sorted(size.id for size in uniform.get_sizes()))
+
     def test_recommend_sizes_perfect_fit(self):
         player_info = example_players_complete[0]
         player = create_player(player_info=player_info)
@@ -152,6 +159,19 @@ class UniformModelTests(TestCase):
         self.assertEqual(sizes_with_quantities[4]["quantity"], 0)
         self.assertEqual(sizes_with_quantities[5]["quantity"], 2)
 
+    def test_get_sizes_with_quantities_same_name_different_gender(self):
+        sizes = [
+            {  "gender":"female", "american_size":"M", "european_size":"40", "chest_min":"90", "chest_max":"94", "waist_min":"74", "waist_max":"78" },
+            {  "gender":"male", "american_size":"M", "european_size":"40", "chest_min":"98", "chest_max":"102", "waist_min":"86", "waist_max":"90" },
+        ]
+        uniform = create_uniform_with_players_and_sizes(sizes=sizes, group_name="Pilots")
+        players_with_sizes = uniform.get_players_with_recommended_sizes()
+        sizes_with_quantities = uniform.get_sizes_with_quantities(players_with_sizes)
+        self.assertEqual(sizes_with_quantities[0]["gender"].name, "female")
+        self.assertEqual(sizes_with_quantities[0]["quantity"], 1)
+        self.assertEqual(sizes_with_quantities[1]["gender"].name, "male")
+        self.assertEqual(sizes_with_quantities[1]["quantity"], 2)
+
     def test_update_quantities_no_valid_sizes(self):
         uniform = create_uniform("")
         players_with_sizes = uniform.get_players_with_recommended_sizes()
@@ -177,3 +197,59 @@ class UniformModelTests(TestCase):
         self.assertEqual(len(player_returned["sizes"]), 1)
         # Ensure that it returns the correct size for the repeated player
         self.assertEqual(str(player_returned["sizes"][0]), "female. M/42 chest(94,98) waist(78,82)")
+
+    def test_procurement_report_same_quantities_as_uniform_sizes(self):
+        players_info = example_players_complete + [
+            { "username": "Big_Ben", "first_name": "Big", "last_name": "Ben", "gender":"male", "chest":130, "waist":110 },
+            { "username": "Lola_Flores", "first_name": "Lola", "last_name": "Flores", "gender":"female", "chest":92, "waist":80 },
+        ]
+        characters = example_characters + ["Tony Stark"]
+        pilots = create_uniform_with_player_in_several_runs(sizes=example_sizes, players_info=players_info,
+                                                           characters_names=characters, player_in_several_runs=players_info[1],
+                                                           group_name="Pilots", runs=2)
+        female = Gender.objects.get(name="female")
+        PlayerMeasurement.objects.filter(user__username="Lola_Flores").update(gender=female)
+        mechanics = create_uniform_with_sizes(example_sizes[3:], group_name="Mechanics")
+        with self.assertNumQueries(3):
+            report = Uniform.objects.procurement_report()
+        self.assertEqual([uniform_report["uniform"] for uniform_report in report], [pilots, mechanics])
+        for uniform_report in report:
+            uniform = uniform_report["uniform"]
+            expected = uniform.get_sizes_with_quantities(uniform.get_players_with_recommended_sizes())
+            self.assertEqual([(size["info"], size["quantity"]) for size in uniform_report["sizes"]],
+                             [(size["info"], size["quantity"]) for size in expected])
+        self.assertEqual(report[0]["without_size"], 1)
+        self.assertEqual(report[1]["without_size"], 0)
+
+    def test_procurement_report_one_gender_per_player(self):
+        player_info = { "username": "Alex_Ruiz", "first_name": "Alex", "last_name": "Ruiz", "chest":92, "waist":80 }
+        uniform = create_uniform_with_sizes(example_sizes, group_name="Pilots")
+        female = Gender.objects.get(name="female")
+        male = Gender.objects.get(name="male")
+        first_run = create_character_assigment(uniform.group, player_info, example_characters[0], run=1)
+        second_run = create_character_assigment(uniform.group, player_info, example_characters[1], run=2)
+        CharacterAssigment.objects.filter(id=first_run.id).update(gender=female)
+        CharacterAssigment.objects.filter(id=second_run.id).update(gender=male)
+
+        report = Uniform.objects.procurement_report()
+        expected = uniform.get_sizes_with_quantities(uniform.get_players_with_recommended_sizes())
+        self.assertEqual([size["quantity"] for size in report[0]["sizes"]], [size["quantity"] for size in expected])
+        self.assertEqual([size["quantity"] for size in report[0]["sizes"]], [0, 0, 1, 0, 0, 0])
+
+    def test_procurement_report_player_fits_sizes_of_different_genders(self):
+        sizes = [
+            {  "gender":"male", "american_size":"S", "european_size":"38", "chest_min":"80", "chest_max":"84", "waist_min":"64", "waist_max":"68" },
+            {  "gender":"unisex", "american_size":"M", "european_size":"40", "chest_min":"90", "chest_max":"94", "waist_min":"74", "waist_max":"78" },
+            {  "gender":"male", "american_size":"M", "european_size":"40", "chest_min":"90", "chest_max":"94", "waist_min":"74", "waist_max":"78" },
+            {  "gender":"female", "american_size":"M", "european_size":"40", "chest_min":"90", "chest_max":"94", "waist_min":"74", "waist_max":"78" },
+        ]
+        player_info = { "username": "Alex_Ruiz", "first_name": "Alex", "last_name": "Ruiz", "chest":92, "waist":76 }
+        uniform = create_uniform_with_sizes(sizes, group_name="Pilots")
+        create_character_assigment(uniform.group, player_info, example_characters[0], run=1)
+
+        report = Uniform.objects.procurement_report()
+        expected = uniform.get_sizes_with_quantities(uniform.get_players_with_recommended_sizes())
+        self.assertEqual([(size["info"], size["quantity"]) for size in report[0]["sizes"]],
+                         [(size["info"], size["quantity"]) for size in expected])
+        self.assertEqual([size["quantity"] for size in report[0]["sizes"]], [0, 1, 0, 0])
+        self.assertEqual(report[0]["sizes"][1]["info"].gender.name, "unisex")
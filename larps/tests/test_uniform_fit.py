@@ -0,0 +1,295 @@
+import itertools
+import random
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from larps.models import CharacterAssigment, Gender, PlayerMeasurement, Uniform, UniformSize
+from larps.uniform_fit import KDTree, RecommendationCache, SizeIndex, StockAllocation, get_measurements, sizes_version_key
+from .util_test_uniforms import create_uniform_with_sizes, create_uniform_with_players_and_sizes
+from .examples import example_players_complete, example_players_incomplete, example_sizes, example_sizes_info
+
+
+def random_sizes(number_of_sizes, seed=0):
+    generator = random.Random(seed)
+    sizes = []
+    for _ in range(0, number_of_sizes):
+        chest_min = generator.randint(70, 130)
+        waist_min = generator.randint(55, 115)
+        sizes.append(UniformSize(american_size="", european_size="",
+                                 chest_min=chest_min, chest_max=chest_min + generator.randint(-2, 8),
+                                 waist_min=waist_min, waist_max=waist_min + generator.randint(-2, 8)))
+    return sizes
+
+
+class SizeIndexTests(TestCase):
+
+    def test_recommend_no_sizes(self):
+        size_index = SizeIndex([])
+        self.assertIs(size_index.recommend(90, 75), None)
+
+    def test_perfect_fit(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        size_index = uniform.get_size_index()
+        sizes = size_index.perfect_fit(90, 75)
+        self.assertEqual([str(size) for size in sizes], [example_sizes_info[1]])
+
+    def test_valid_fit(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        size_index = uniform.get_size_index()
+        sizes = size_index.valid_fit(91, 73)
+        self.assertEqual([str(size) for size in sizes], [example_sizes_info[1], example_sizes_info[3]])
+
+    def test_valid_fit_none(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        size_index = uniform.get_size_index()
+        self.assertIs(size_index.valid_fit(120, 100), None)
+
+    def test_same_results_as_size_methods(self):
+        uniform = Uniform(name="")
+        sizes = random_sizes(40)
+        size_index = SizeIndex(sizes)
+        for chest in range(65, 140):
+            for waist in range(50, 125, 3):
+                perfect_fit = uniform.find_perfect_fit(sizes, chest, waist)
+                valid_fit = uniform.find_valid_fit(sizes, chest, waist)
+                self.assertEqual(size_index.perfect_fit(chest, waist), perfect_fit)
+                self.assertEqual(size_index.valid_fit(chest, waist), valid_fit)
+
+    def test_recommend_batch_no_sizes(self):
+        size_index = SizeIndex([])
+        self.assertEqual(size_index.recommend_batch([(90, 75), (100, 90)]), [None, None])
+
+    def test_recommend_batch_same_results_as_recommend(self):
+        generator = random.Random(1)
+        size_index = SizeIndex(random_sizes(40))
+        measurements = [(generator.randint(60, 140), generator.randint(45, 130)) for _ in range(0, 500)]
+        recommendations = size_index.recommend_batch(measurements)
+        for (chest, waist), sizes in zip(measurements, recommendations):
+            self.assertEqual(sizes, size_index.recommend(chest, waist))
+
+
+class SizeRankingTests(TestCase):
+
+    def test_rank_all_measurements(self):
+        sizes = [
+            UniformSize(chest_min=90, chest_max=94, waist_min=74, waist_max=78, arm_min=58, arm_max=60, body_min=160, body_max=170),
+            UniformSize(chest_min=90, chest_max=94, waist_min=74, waist_max=78, arm_min=62, arm_max=64, body_min=170, body_max=180),
+            UniformSize(chest_min=98, chest_max=102, waist_min=82, waist_max=86),
+        ]
+        player = PlayerMeasurement(chest=92, waist=76, arm_length=63, body_length=175, shoulder_length=40)
+        ranking = SizeIndex(sizes).rank(get_measurements(player))
+        self.assertEqual(ranking, [(sizes[1], 0), (sizes[0], 8), (sizes[2], 12)])
+
+    def test_rank_without_measurements(self):
+        size_index = SizeIndex(random_sizes(5))
+        self.assertEqual(size_index.rank((0, 0, 0, 0, 0, 0)), [])
+
+    def test_rank_batch_same_results_as_rank(self):
+        size_index = SizeIndex(random_sizes(20))
+        measurements_list = [(90, 60, 75, 0, 0, 170), (100, 0, 90, 45, 0, 0), (90, 60, 75, 0, 0, 170)]
+        rankings = size_index.rank_batch(measurements_list)
+        self.assertEqual(rankings, [size_index.rank(measurements) for measurements in measurements_list])
+
+
+class NearestSizeTests(TestCase):
+
+    def test_kd_tree_same_results_as_sorting(self):
+        generator = random.Random(2)
+        points = [(generator.randint(70, 130), generator.randint(55, 115)) for _ in range(0, 60)]
+        tree = KDTree(points)
+        for _ in range(0, 200):
+            point = (generator.randint(50, 150), generator.randint(40, 130))
+            distances = sorted((sum((a - b) ** 2 for a, b in zip(point, points[p])), p) for p in range(len(points)))
+            expected = [(p, distance ** 0.5) for distance, p in distances[:3]]
+            self.assertEqual(tree.nearest(point, k=3), expected)
+
+    def test_kd_tree_empty(self):
+        self.assertEqual(KDTree([]).nearest((90, 75), k=3), [])
+
+    def test_nearest(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        nearest = uniform.get_size_index().nearest(130, 110, k=2)
+        self.assertEqual([str(size) for size, _ in nearest], [example_sizes_info[5], example_sizes_info[4]])
+        self.assertAlmostEqual(nearest[0][1], (30 ** 2 + 22 ** 2) ** 0.5)
+
+    def test_nearest_by_gender(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        female = Gender.objects.get(name="female")
+        nearest = uniform.get_size_partitions().get(female.id).nearest(130, 110, k=1)
+        self.assertEqual(str(nearest[0][0]), example_sizes_info[2])
+
+    def test_players_without_valid_size_get_closest_sizes(self):
+        players = [{ "username": "Big_Ben", "first_name": "Big", "last_name": "Ben", "gender":"male", "chest":130, "waist":110 }]
+        uniform = create_uniform_with_players_and_sizes(sizes=example_sizes, players_info=players, group_name="Pilots")
+        player = uniform.get_players_with_recommended_sizes()[0]
+        self.assertIs(player["sizes"], None)
+        self.assertEqual(len(player["closest_sizes"]), 3)
+        self.assertEqual(str(player["closest_sizes"][0][0]), example_sizes_info[5])
+
+
+class SizePartitionsTests(TestCase):
+
+    def test_partitions_by_gender_with_unisex_sizes(self):
+        sizes = example_sizes + [{ "gender":"", "american_size":"XL", "european_size":"", "chest_min":"102", "chest_max":"110", "waist_min":"86", "waist_max":"96" }]
+        uniform = create_uniform_with_sizes(sizes)
+        partitions = uniform.get_size_partitions()
+        female = Gender.objects.get(name="female")
+        male = Gender.objects.get(name="male")
+        self.assertEqual([size.european_size for size in partitions.get(female.id).sizes], ["38", "40", "42", ""])
+        self.assertEqual([size.european_size for size in partitions.get(male.id).sizes], ["46", "48", "50", ""])
+        self.assertEqual(len(partitions.get(None).sizes), len(sizes))
+
+    def test_gender_without_sizes_uses_all_sizes(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        other = Gender.objects.create(name="non binary")
+        partitions = uniform.get_size_partitions()
+        self.assertIs(partitions.get_gender(other.id), None)
+        self.assertEqual(len(partitions.get(other.id).sizes), len(example_sizes))
+
+    def test_recommend_sizes_by_profile_gender(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        player = PlayerMeasurement(chest=92, waist=80, gender=Gender.objects.get(name="male"))
+        self.assertEqual([str(size) for size in uniform.recommend_sizes(player)], [example_sizes_info[3]])
+        player.gender = Gender.objects.get(name="female")
+        self.assertEqual([str(size) for size in uniform.recommend_sizes(player)], [example_sizes_info[2]])
+
+    def test_players_with_recommended_sizes_by_assigment_gender(self):
+        players = [{ "username": "Ana_Garcia", "first_name": "Ana", "last_name": "Garcia", "gender":"female", "chest":92, "waist":80 }]
+        uniform = create_uniform_with_players_and_sizes(sizes=example_sizes, players_info=players, group_name="Pilots")
+        female = Gender.objects.get(name="female")
+        CharacterAssigment.objects.update(gender=female)
+        player = uniform.get_players_with_recommended_sizes()[0]
+        self.assertEqual([str(size) for size in player["sizes"]], [example_sizes_info[2]])
+
+
+class RecommendationCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_recommend_batch_same_results_as_size_index(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        measurements = [(90, 75), (95, 78), (100, 90), (120, 100)]
+        expected = uniform.get_size_index().recommend_batch(measurements)
+        recommendations = RecommendationCache(uniform)
+        self.assertEqual(recommendations.recommend_batch(recommendations.get_size_index(), measurements), expected)
+        self.assertEqual(recommendations.recommend_batch(recommendations.get_size_index(), measurements), expected)
+
+    # repeated loads only read the cache: one entry for the version, the sizes and the recommendations.
+    def test_repeated_recommendations_only_read_the_cache(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        queries = []
+        for measurements in [[(90, 75), (100, 90)], [(80 + i % 40, 60 + i // 10) for i in range(0, 400)]]:
+            recommendations = RecommendationCache(uniform)
+            recommendations.recommend_batch(recommendations.get_size_index(), measurements)
+            with CaptureQueriesContext(connection) as repeated_load:
+                recommendations = RecommendationCache(uniform)
+                sizes = recommendations.recommend_batch(recommendations.get_size_index(), measurements)
+            self.assertTrue(all("larps_cache" in query["sql"] for query in repeated_load.captured_queries))
+            queries.append(len(repeated_load))
+        self.assertEqual(queries, [3, 3])
+        self.assertEqual(str(RecommendationCache(uniform).recommend_batch(recommendations.get_size_index(), [(90, 75)])[0][0]),
+                         example_sizes_info[1])
+
+    def test_sizes_with_quantities_read_the_sizes_from_the_cache(self):
+        uniform = create_uniform_with_players_and_sizes(sizes=example_sizes, group_name="Pilots")
+        expected = uniform.get_sizes_with_quantities(uniform.get_players_with_recommended_sizes())
+        with CaptureQueriesContext(connection) as repeated_load:
+            sizes_with_quantities = uniform.get_sizes_with_quantities(uniform.get_players_with_recommended_sizes())
+        self.assertFalse(any("larps_uniformsize" in query["sql"] for query in repeated_load.captured_queries))
+        self.assertEqual([(size["info"], size["quantity"]) for size in sizes_with_quantities],
+                         [(size["info"], size["quantity"]) for size in expected])
+
+    # the import worker and the web server are different processes: the version is read from the shared cache.
+    def test_sizes_changed_by_another_process(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        RecommendationCache(uniform)
+        other_process = DatabaseCache(settings.CACHES['default']['LOCATION'], {})
+        other_process.set(sizes_version_key(uniform.id), "new version", None)
+        self.assertEqual(RecommendationCache(uniform).version, "new version")
+
+    def test_new_size_invalidates_recommendations(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        recommendations = RecommendationCache(uniform)
+        self.assertIs(recommendations.recommend_batch(recommendations.get_size_index(), [(120, 100)])[0], None)
+        size = uniform.add_size({"gender": "male", "american_size": "XL", "european_size": "56",
+                                 "chest_min": "118", "chest_max": "122", "waist_min": "98", "waist_max": "102"})
+        recommendations = RecommendationCache(uniform)
+        self.assertEqual(recommendations.recommend_batch(recommendations.get_size_index(), [(120, 100)])[0], [size])
+        size.delete()
+        recommendations = RecommendationCache(uniform)
+        self.assertIs(recommendations.recommend_batch(recommendations.get_size_index(), [(120, 100)])[0], None)
+
+    def test_rank_batch_same_results_as_size_index(self):
+        uniform = create_uniform_with_sizes(example_sizes)
+        measurements_list = [(90, 0, 75, 0, 0, 0), (120, 60, 100, 45, 50, 170)]
+        expected = uniform.get_size_index().rank_batch(measurements_list)
+        for _ in range(0, 2):
+            recommendations = RecommendationCache(uniform)
+            self.assertEqual(recommendations.rank_batch(recommendations.get_size_index(), measurements_list), expected)
+
+
+# best (number of players with a garment, total cost) trying every possible allocation.
+def brute_force_allocation(costs, stock):
+    best = None
+    for allocation in itertools.product(*[[None] + list(player_costs) for player_costs in costs]):
+        used = [allocation.count(position) for position in range(0, len(stock))]
+        if any(quantity > available for quantity, available in zip(used, stock)):
+            continue
+        result = (-len([position for position in allocation if position is not None]),
+                  sum(costs[player][position] for player, position in enumerate(allocation) if position is not None))
+        if best is None or result < best:
+            best = result
+    return best
+
+
+class StockAllocationTests(TestCase):
+
+    def test_same_results_as_brute_force(self):
+        generator = random.Random(3)
+        for _ in range(0, 200):
+            number_of_sizes = generator.randint(1, 4)
+            costs = [{position: generator.randint(0, 9) for position in range(0, number_of_sizes) if generator.random() < 0.8}
+                     for _ in range(0, generator.randint(0, 5))]
+            stock = [generator.randint(0, 3) for _ in range(0, number_of_sizes)]
+            allocation = StockAllocation(costs, stock).solve()
+            for position, available in enumerate(stock):
+                self.assertLessEqual(allocation.count(position), available)
+            result = (-len([position for position in allocation if position is not None]),
+                      sum(costs[player][position] for player, position in enumerate(allocation) if position is not None))
+            self.assertEqual(result, brute_force_allocation(costs, stock))
+
+    def test_players_move_to_free_the_closest_size(self):
+        costs = [{0: 0, 1: 1}, {0: 0, 1: 5}]
+        self.assertEqual(StockAllocation(costs, [1, 1]).solve(), [1, 0])
+
+    def test_not_enough_stock(self):
+        costs = [{0: 0}, {0: 2}, {1: 0}]
+        self.assertEqual(StockAllocation(costs, [1, 0]).solve(), [0, None, None])
+
+    def test_allocate_sizes(self):
+        uniform = create_uniform_with_players_and_sizes(sizes=example_sizes, group_name="Pilots")
+        for player_info in example_players_complete:
+            PlayerMeasurement.objects.filter(user__username=player_info["username"]).update(
+                gender=Gender.objects.get(name=player_info["gender"]))
+        sizes = {size.european_size: size for size in uniform.get_sizes()}
+        stock = {sizes["40"].id: 1, sizes["48"].id: 1, sizes["50"].id: 1}
+        allocation = uniform.allocate_sizes(stock)
+        allocated = {player["info"].user.username: player["allocated_size"] for player in allocation["players"]}
+        self.assertEqual(allocated, {"Ana_Garcia": sizes["40"], "Pepa_Perez": None,
+                                     "Manolo_Garcia": sizes["50"], "Paco_Garcia": sizes["48"]})
+        self.assertEqual([player["info"].user.username for player in allocation["unallocated"]], ["Pepa_Perez"])
+        self.assertEqual(sum(allocation["remaining_stock"].values()), 0)
+
+    def test_players_without_measurements(self):
+        uniform = create_uniform_with_players_and_sizes(sizes=example_sizes, players_info=example_players_incomplete, group_name="Pilots")
+        players = uniform.get_players_with_recommended_sizes()
+        self.assertEqual([(player["ranking"], player["best_fit"], player["closest_sizes"]) for player in players],
+                         [([], None, None), ([], None, None)])
+        stock = {size.id: 1 for size in uniform.get_sizes()}
+        allocation = uniform.allocate_sizes(stock)
+        self.assertEqual(len(allocation["unallocated"]), 2)
+        self.assertEqual(sum(allocation["remaining_stock"].values()), len(stock))
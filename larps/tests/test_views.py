@@ -1,9 +1,10 @@
 from django.test import TestCase
 from django.urls import reverse
 from .util_test_views import test_correct_page, test_login
-from larps.models import Bookings
+from larps.models import Bookings, Character, PlayerMeasurement
 from larps.views import generate_bookings
-from .util_test import create_group, create_character_assigment
+from larps.views_util import CHARACTERS_PER_PAGE, find_character, get_characters, get_measurements
+from .util_test import create_group, create_character, create_character_assigment, create_user
 
 
 class ViewsTests(TestCase):
@@ -33,3 +34,39 @@ class ViewsTests(TestCase):
         bookings_search = Bookings.objects.all()
         self.assertIs(len(bookings_search), 1)
         self.assertEqual(bookings_search[0].user.username, user.username)
+
+    def test_find_character(self):
+        group = create_group()
+        assigment = create_character_assigment(group)
+        with self.assertNumQueries(1):
+            character = find_character(assigment.user, group.larp, assigment.run)
+        self.assertEqual(character, assigment.character)
+        self.assertIs(find_character(assigment.user, group.larp, assigment.run + 1), None)
+
+    def test_get_measurements_inserted_by_another_request(self):
+        user = create_user()
+        measurements = get_measurements(user)
+        # the uniform report inserts the profile of the same user in the meantime.
+        PlayerMeasurement.objects.get_or_insert(user=user)
+        data = dict(measurements.get_data(), chest=92, waist=76)
+        measurements.save_profile(data)
+        self.assertEqual(PlayerMeasurement.objects.filter(user=user).count(), 1)
+        self.assertEqual(PlayerMeasurement.objects.get(user=user).chest, 92)
+
+    def test_get_characters_of_larp(self):
+        group = create_group(group_name="Pilots", larp_name="Mission Together")
+        other_group = create_group(group_name="Marines", larp_name="Another Larp")
+        create_character("Kara", group=group)
+        create_character("Lee", group=other_group)
+        create_character("Nobody")
+        with self.assertNumQueries(2):
+            characters = get_characters(group.larp)
+            names = [(character.name, character.group.name) for character in characters]
+        self.assertEqual(names, [("Kara", "Pilots")])
+
+    def test_get_characters_pages(self):
+        group = create_group()
+        Character.objects.bulk_create([Character(name="%03d" % i, group=group) for i in range(0, CHARACTERS_PER_PAGE + 1)])
+        self.assertEqual(len(get_characters(group.larp)), CHARACTERS_PER_PAGE)
+        last_page = get_characters(group.larp, 2)
+        self.assertEqual([character.name for character in last_page], ["%03d" % CHARACTERS_PER_PAGE])
@@ -0,0 +1,449 @@
+import heapq
+import math
+import uuid
+from bisect import bisect_left, bisect_right
+from django.core.cache import cache
+
+
+# player measurement and size range of every dimension used to rank the sizes.
+DIMENSIONS = [
+    ("chest", "chest"),
+    ("arm_length", "arm"),
+    ("waist", "waist"),
+    ("shoulder_length", "shoulder"),
+    ("torso_length", "torso"),
+    ("body_length", "body"),
+]
+
+def get_measurements(player):
+    return tuple(getattr(player, measurement) for measurement, _ in DIMENSIONS)
+
+
+# INDEX OF UNIFORM SIZES BY MEASUREMENT RANGES
+
+class RangeIndex:
+    """Ranges (min, max) of one measurement sorted by their max value.
+
+    A measurement fits a range when min <= value <= max. As no range is wider than
+    the widest one, the ranges that contain the value are the ones whose max is
+    between value and value + widest range, found with two binary searches.
+    """
+
+    def __init__(self, ranges):
+        positions = sorted(range(len(ranges)), key=lambda position: ranges[position][1])
+        self.ranges = ranges
+        self.positions = positions
+        self.maximums = [ranges[position][1] for position in positions]
+        widths = [maximum - minimum for minimum, maximum in ranges if minimum <= maximum]
+        self.width = max(widths) if widths else 0
+
+    # returns the positions of the ranges that contain the value.
+    def containing(self, value):
+        start = bisect_left(self.maximums, value)
+        end = bisect_right(self.maximums, value + self.width)
+        return [position for position in self.positions[start:end] if self.ranges[position][0] <= value]
+
+
+class Measurements:
+    """One measurement of a list of players, sorted to find the players within a range."""
+
+    def __init__(self, values):
+        self.players = sorted(range(len(values)), key=lambda player: values[player])
+        self.values = [values[player] for player in self.players]
+
+    # returns the players whose measurement is between minimum and maximum (both included).
+    def between(self, minimum, maximum):
+        start = bisect_left(self.values, minimum)
+        end = bisect_right(self.values, maximum)
+        return self.players[start:end]
+
+
+class SizeIndex:
+    """Chest and waist index of the sizes of a uniform, built once and used for every player."""
+
+    def __init__(self, sizes):
+        self.sizes = list(sizes)
+        self.chest = RangeIndex([(size.chest_min, size.chest_max) for size in self.sizes])
+        self.waist = RangeIndex([(size.waist_min, size.waist_max) for size in self.sizes])
+        self.dimensions = []
+        for _, size_range in DIMENSIONS:
+            minimum, maximum = size_range + "_min", size_range + "_max"
+            self.dimensions.append([(getattr(size, minimum), getattr(size, maximum)) for size in self.sizes])
+        self.tree = None
+
+    def get_sizes(self, positions):
+        return [self.sizes[position] for position in sorted(positions)]
+
+    # sizes where both chest and waist fit (UniformSize.perfect_fit).
+    def perfect_fit(self, chest, waist):
+        positions = [p for p in self.chest.containing(chest) if self.waist_fit(p, waist)]
+        return self.get_sizes(positions)
+
+    # sizes where the chest fits and the waist is not too small, or the waist fits and
+    # the chest is not too small (UniformSize chest_fit/waist_fit and *_minimum_fit).
+    def valid_fit(self, chest, waist):
+        positions = set(p for p in self.chest.containing(chest) if self.waist_minimum_fit(p, waist))
+        positions.update(p for p in self.waist.containing(waist) if self.chest_minimum_fit(p, chest))
+        if positions:
+            return self.get_sizes(positions)
+        return None
+
+    def recommend(self, chest, waist):
+        if not self.sizes:
+            return None
+        perfect_fit = self.perfect_fit(chest, waist)
+        if perfect_fit:
+            return perfect_fit
+        return self.valid_fit(chest, waist)
+
+    # recommends sizes for a whole list of (chest, waist) measurements at once, with the same
+    # result as recommend() for each of them. Instead of searching the sizes for every player,
+    # the players are sorted by chest and by waist and every size finds the players it fits.
+    def recommend_batch(self, measurements):
+        if not self.sizes:
+            return [None for _ in measurements]
+        players_by_chest = Measurements([chest for chest, _ in measurements])
+        players_by_waist = Measurements([waist for _, waist in measurements])
+
+        perfect_fit = [[] for _ in measurements]
+        for position, (chest_min, chest_max) in enumerate(self.chest.ranges):
+            waist_min, waist_max = self.waist.ranges[position]
+            for player in players_by_chest.between(chest_min, chest_max):
+                if waist_min <= measurements[player][1] <= waist_max:
+                    perfect_fit[player].append(position)
+
+        valid_fit = [set() for _ in measurements]
+        for position, (chest_min, chest_max) in enumerate(self.chest.ranges):
+            waist_min, waist_max = self.waist.ranges[position]
+            for player in players_by_chest.between(chest_min, chest_max):
+                if not perfect_fit[player] and self.waist_minimum_fit(position, measurements[player][1]):
+                    valid_fit[player].add(position)
+            for player in players_by_waist.between(waist_min, waist_max):
+                if not perfect_fit[player] and self.chest_minimum_fit(position, measurements[player][0]):
+                    valid_fit[player].add(position)
+
+        recommendations = []
+        for player in range(0, len(measurements)):
+            if perfect_fit[player]:
+                recommendations.append(self.get_sizes(perfect_fit[player]))
+            elif valid_fit[player]:
+                recommendations.append(self.get_sizes(valid_fit[player]))
+            else:
+                recommendations.append(None)
+        return recommendations
+
+    # distance in cm between the measurements (in DIMENSIONS order) and the ranges of every size,
+    # 0 when everything fits. Measurements of 0 and sizes without a range for them are not counted.
+    def distances(self, measurements):
+        scores = [0] * len(self.sizes)
+        for value, ranges in zip(measurements, self.dimensions):
+            if not value:
+                continue
+            for position, (minimum, maximum) in enumerate(ranges):
+                if not maximum:
+                    continue
+                if value < minimum:
+                    scores[position] += minimum - value
+                elif value > maximum:
+                    scores[position] += value - maximum
+        return scores
+
+    # returns every size with its distance to the measurements, closest first. A player without
+    # measurements is not ranked: every size would be 0 cm off.
+    def rank(self, measurements):
+        if not any(measurements):
+            return []
+        scores = self.distances(measurements)
+        positions = sorted(range(len(self.sizes)), key=lambda position: scores[position])
+        return [(self.sizes[position], scores[position]) for position in positions]
+
+    def rank_batch(self, measurements_list):
+        rankings = {}
+        for measurements in measurements_list:
+            if measurements not in rankings:
+                rankings[measurements] = self.rank(measurements)
+        return [rankings[measurements] for measurements in measurements_list]
+
+    # returns the k sizes whose chest and waist range centers are closest to the measurements,
+    # with their distance in cm. The k-d tree is only built the first time it is needed.
+    def nearest(self, chest, waist, k=3):
+        if self.tree is None:
+            self.tree = KDTree([range_center(size) for size in self.sizes])
+        return [(self.sizes[position], distance) for position, distance in self.tree.nearest((chest, waist), k)]
+
+    def waist_fit(self, position, waist):
+        minimum, maximum = self.waist.ranges[position]
+        return minimum <= waist <= maximum
+
+    def chest_minimum_fit(self, position, chest):
+        return max(self.chest.ranges[position]) >= chest
+
+    def waist_minimum_fit(self, position, waist):
+        return max(self.waist.ranges[position]) >= waist
+
+
+# NEAREST SIZES WHEN NOTHING FITS
+
+class KDTree:
+    """k-d tree over a list of points, to find the k points closest to a given one."""
+
+    def __init__(self, points):
+        self.points = points
+        self.dimensions = len(points[0]) if points else 0
+        self.root = self.build(list(range(len(points))), 0)
+
+    # every node is (point position, axis, left subtree, right subtree).
+    def build(self, positions, depth):
+        if not positions:
+            return None
+        axis = depth % self.dimensions
+        positions = sorted(positions, key=lambda position: (self.points[position][axis], position))
+        median = len(positions) // 2
+        return (positions[median], axis,
+                self.build(positions[:median], depth + 1), self.build(positions[median + 1:], depth + 1))
+
+    # returns the positions of the k closest points with their distance, closest (then first) first.
+    def nearest(self, point, k=1):
+        closest = []
+        self.search(self.root, point, k, closest)
+        found = sorted((-distance, -position) for distance, position in closest)
+        return [(position, math.sqrt(distance)) for distance, position in found]
+
+    def search(self, node, point, k, closest):
+        if node is None:
+            return
+        position, axis, left, right = node
+        distance = sum((a - b) ** 2 for a, b in zip(point, self.points[position]))
+        # closest is a max-heap (negated values) with the k best (distance, position) found so far.
+        if len(closest) < k:
+            heapq.heappush(closest, (-distance, -position))
+        elif (distance, position) < (-closest[0][0], -closest[0][1]):
+            heapq.heapreplace(closest, (-distance, -position))
+        difference = point[axis] - self.points[position][axis]
+        near, far = (left, right) if difference < 0 else (right, left)
+        self.search(near, point, k, closest)
+        if len(closest) < k or difference ** 2 <= -closest[0][0]:
+            self.search(far, point, k, closest)
+
+
+def range_center(size):
+    return ((size.chest_min + size.chest_max) / 2, (size.waist_min + size.waist_max) / 2)
+
+
+# SIZES BY GENDER
+
+def is_unisex(size):
+    return size.gender is None or size.gender.name == "unisex"
+
+
+class SizePartitions:
+    """Size indexes of a uniform split by gender, built once for all the players.
+
+    Every gender gets its sizes plus the unisex ones. Players without gender, or with a
+    gender that has no sizes in this uniform, are matched against all the sizes.
+    """
+
+    def __init__(self, sizes):
+        sizes = list(sizes)
+        self.indexes = {None: SizeIndex(sizes)}
+        genders = []
+        for size in sizes:
+            if not is_unisex(size) and size.gender_id not in genders:
+                genders.append(size.gender_id)
+        for gender_id in genders:
+            self.indexes[gender_id] = SizeIndex([size for size in sizes if size.gender_id == gender_id or is_unisex(size)])
+
+    @property
+    def sizes(self):
+        return self.indexes[None].sizes
+
+    # returns the gender whose partition is used for players of this gender.
+    def get_gender(self, gender_id):
+        if gender_id in self.indexes:
+            return gender_id
+        return None
+
+    def get(self, gender_id):
+        return self.indexes[self.get_gender(gender_id)]
+
+
+# CACHE OF SIZE RECOMMENDATIONS
+# Stored in the shared cache of settings.CACHES, so a size saved by any process (the web server
+# or the import worker) changes the version read by all of them.
+
+# entries of old size table versions are never read again and expire after this time (in seconds).
+RECOMMENDATIONS_TIMEOUT = 7 * 24 * 60 * 60
+
+def sizes_version_key(uniform_id):
+    return "uniform_sizes_version_" + str(uniform_id)
+
+def get_sizes_version(uniform_id):
+    return cache.get_or_set(sizes_version_key(uniform_id), uuid.uuid4().hex, None)
+
+# called every time a uniform or one of its sizes changes: entries of the old version are never read again.
+def invalidate_sizes(uniform_id):
+    cache.set(sizes_version_key(uniform_id), uuid.uuid4().hex, None)
+
+
+class RecommendationCache:
+    """Size table and recommendations of a uniform, stored by (uniform, size table version, partition).
+
+    Every partition of the sizes (SizePartitions) is a single cache entry with the values of all
+    the measurements computed so far, so a page reads one entry whatever the size of the group.
+    """
+
+    def __init__(self, uniform):
+        self.uniform = uniform
+        self.version = get_sizes_version(uniform.id)
+
+    def key(self, name, gender_id):
+        return "uniform_%s_%s_%s_%s" % (name, self.uniform.id, self.version, gender_id)
+
+    def get_sizes(self):
+        key = "uniform_sizes_%s_%s" % (self.uniform.id, self.version)
+        return cache.get_or_set(key, lambda: list(self.uniform.get_sizes()), RECOMMENDATIONS_TIMEOUT)
+
+    def get_size_index(self):
+        return SizeIndex(self.get_sizes())
+
+    def get_size_partitions(self):
+        return SizePartitions(self.get_sizes())
+
+    # returns the cached value of every measurement, computing the missing ones and storing them
+    # in the entry of the partition.
+    def get_many(self, name, gender_id, measurements_list, compute):
+        key = self.key(name, gender_id)
+        values = cache.get(key, {})
+        missing = list(dict.fromkeys(measurements for measurements in measurements_list if measurements not in values))
+        if missing:
+            values.update(zip(missing, compute(missing)))
+            cache.set(key, values, RECOMMENDATIONS_TIMEOUT)
+        return [values[measurements] for measurements in measurements_list]
+
+    # same result as size_index.recommend_batch(), only the measurements not in the cache are computed.
+    # gender_id tells which partition of the sizes (SizePartitions) the size index is.
+    def recommend_batch(self, size_index, measurements, gender_id=None):
+        def compute(missing):
+            return [[size.id for size in sizes or []] for sizes in size_index.recommend_batch(missing)]
+
+        sizes_by_id = {size.id: size for size in size_index.sizes}
+        recommendations = []
+        for sizes_ids in self.get_many("fit", gender_id, measurements, compute):
+            if sizes_ids:
+                recommendations.append([sizes_by_id[size_id] for size_id in sizes_ids])
+            else:
+                recommendations.append(None)
+        return recommendations
+
+    # same result as size_index.rank_batch(), only the measurements not in the cache are computed.
+    def rank_batch(self, size_index, measurements_list, gender_id=None):
+        def compute(missing):
+            rankings = size_index.rank_batch(missing)
+            return [[(size.id, score) for size, score in ranking] for ranking in rankings]
+
+        sizes_by_id = {size.id: size for size in size_index.sizes}
+        rankings = []
+        for ranking in self.get_many("rank", gender_id, measurements_list, compute):
+            rankings.append([(sizes_by_id[size_id], score) for size_id, score in ranking])
+        return rankings
+
+
+# ALLOCATION OF A LIMITED STOCK
+
+class StockAllocation:
+    """Assignment of players to sizes with a limited stock of every size.
+
+    costs has, for every player, a dict {size position: cost} of the sizes the player can get,
+    and stock the number of garments of every size. As many players as possible get a garment,
+    with the minimum total cost (min-cost flow by successive shortest paths).
+
+    The paths are searched only over the sizes: a path starts with a player without a garment
+    taking a size and continues with players moving to another size, until one with stock left.
+    The cheapest move between two sizes is kept in a heap for every pair of sizes, and the
+    potentials of the sizes keep the costs of the moves non-negative for Dijkstra.
+    """
+
+    def __init__(self, costs, stock):
+        self.costs = costs
+        self.stock = list(stock)
+        self.number_of_sizes = len(self.stock)
+
+    # returns the size position assigned to every player, None for the ones left without a garment.
+    def solve(self):
+        sizes = range(0, self.number_of_sizes)
+        self.assigned = [None] * len(self.costs)
+        self.free = list(self.stock)
+        self.potentials = [0] * self.number_of_sizes
+        self.sink_potential = 0
+
+        # players without a garment by cost of every size, and players of every size by cost of moving to another one.
+        self.entries = [[] for _ in sizes]
+        for player, costs in enumerate(self.costs):
+            for position, cost in costs.items():
+                self.entries[position].append((cost, player))
+        for entries in self.entries:
+            heapq.heapify(entries)
+        self.moves = [[[] for _ in sizes] for _ in sizes]
+
+        while self.augment():
+            pass
+        return self.assigned
+
+    # moves one more player into the stock along the cheapest path; False when no path is left.
+    def augment(self):
+        infinite = float("inf")
+        assigned, potentials = self.assigned, self.potentials
+        distances = [infinite] * self.number_of_sizes
+        paths = [None] * self.number_of_sizes
+        queue = []
+        for position, entries in enumerate(self.entries):
+            while entries and assigned[entries[0][1]] is not None:
+                heapq.heappop(entries)
+            if entries:
+                cost, player = entries[0]
+                distances[position] = cost - potentials[position]
+                paths[position] = (player, None)
+                queue.append((distances[position], position))
+        heapq.heapify(queue)
+
+        settled = [False] * self.number_of_sizes
+        sink_distance, last = infinite, None
+        while queue and queue[0][0] < sink_distance:
+            distance, current = heapq.heappop(queue)
+            if settled[current]:
+                continue
+            settled[current] = True
+            if self.free[current] > 0:
+                reduced = distance + potentials[current] - self.sink_potential
+                if reduced < sink_distance:
+                    sink_distance, last = reduced, current
+            for position, moves in enumerate(self.moves[current]):
+                while moves and assigned[moves[0][1]] != current:
+                    heapq.heappop(moves)
+                if not moves or settled[position]:
+                    continue
+                reduced = distance + moves[0][0] + potentials[current] - potentials[position]
+                if reduced < distances[position]:
+                    distances[position] = reduced
+                    paths[position] = (moves[0][1], current)
+                    heapq.heappush(queue, (reduced, position))
+
+        if last is None:
+            return False
+        self.free[last] -= 1
+        position = last
+        while position is not None:
+            player, previous = paths[position]
+            self.assign(player, position)
+            position = previous
+        for position in range(0, self.number_of_sizes):
+            potentials[position] += min(distances[position], sink_distance)
+        self.sink_potential += sink_distance
+        return True
+
+    def assign(self, player, position):
+        self.assigned[player] = position
+        costs = self.costs[player]
+        for other, cost in costs.items():
+            if other != position:
+                heapq.heappush(self.moves[position][other], (cost - costs[position], player))
@@ -14,6 +14,7 @@ urlpatterns = [
     path('my_character/larp_<int:larp_id>/run_<int:run>/', login_required(views.my_character_view), name='my_character'),
     # ADMINS
     path('file_upload/', login_required(views.file_upload_view), name='file_upload'),
+    path('file_upload/job_<int:job_id>/', login_required(views.import_job_progress_view), name='import_job_progress'),
     path('uniforms', login_required(views.uniforms_view), name="uniforms"),
     path('uniform_sizes/<int:uniform_id>', login_required(views.uniform_sizes_view), name="uniform_sizes"),
     path('missing_info/', login_required(views.missing_info_index_view), name="missing_info_index"),
@@ -1,9 +1,9 @@
 from django.contrib.auth import logout
-from django.http import HttpResponseRedirect
-from django.shortcuts import render
+from django.http import HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 
-from .csv_importer import process_csv
+from .csv_importer import preview_csv
 from .forms import *
 from .views_util import *
 
@@ -72,7 +72,7 @@ def manage_bookings_view(request, larp_id, run):
 def characters_run_view(request, larp_id, run):
     template = "larps/character_list.html"
     context = build_context(request, larp_id, run)
-    context['character_list'] = get_characters(context['larp'])
+    context['character_list'] = get_characters(context['larp'], request.GET.get('page'))
     return render(request, template, context)
 
 
@@ -91,21 +91,36 @@ def file_upload_view(request):
     form = ImportCSVForm()
     context = {'form': form, 'user': request.user}
 
+    # the file is imported by the worker (manage.py run_import_jobs) and the page polls its progress.
     if request.method == "POST":
-        file = request.FILES['file']
-        result = process_csv(file)
-        context["result"] = result
+        if request.POST.get('dry_run'):
+            context["diff"] = preview_csv(request.FILES['file'])
+            return render(request, template, context)
+        job = ImportJob(user=request.user, file=request.FILES['file'])
+        job.save()
+        url = reverse('larps:file_upload') + "?job=" + str(job.id)
+        return HttpResponseRedirect(url)
+    job_id = request.GET.get('job', '')
+    if job_id.isdigit():
+        context["job"] = ImportJob.objects.filter(id=job_id).first()
 
     return render(request, template, context)
 
 
+def import_job_progress_view(request, job_id):
+    if not request.user.is_staff:
+        return not_allowed_view(request)
+    job = get_object_or_404(ImportJob, id=job_id)
+    return JsonResponse(job.get_progress())
+
+
 # UNIFORMS
 
 def uniforms_view(request):
     if not request.user.is_staff:
         return not_allowed_view(request)
     template = "larps/uniforms.html"
-    context = {"uniforms": Uniform.objects.all()}
+    context = {"uniforms": Uniform.objects.all(), "report": Uniform.objects.procurement_report()}
     return render(request, template, context)
 
 
@@ -130,10 +145,10 @@ def missing_info_index_view(request):
     if not request.user.is_staff:
         return not_allowed_view(request)
     template = "larps/missing_info_index.html"
-    larps = Larp.objects.all()
+    larps = Larp.objects.with_number_of_runs()
     larps_info = []
     for larp in larps:
-        number_of_runs = larp.get_number_of_runs()
+        number_of_runs = larp.number_of_runs
         info = {"name": larp.name, "id": larp.id,
                 "runs": range(1, number_of_runs+1)}
         larps_info.append(info)
@@ -147,7 +162,7 @@ def players_missing_info_view(request, larp_id):
         return not_allowed_view(request)
     template = "larps/missing_info.html"
     larp = Larp.objects.get(id=larp_id)
-    players_information = larp.get_players_information()
+    players_information = larp.get_players_missing_information()
     context = {"larp": larp.name, "larp_id": larp_id,
                 "players_information": players_information}
     return render(request, template, context)
@@ -158,11 +173,7 @@ def players_missing_info_by_run_view(request, larp_id, run):
         return not_allowed_view(request)
     template = "larps/missing_info.html"
     larp = Larp.objects.get(id=larp_id)
-    players_information_all_runs = larp.get_players_information()
-    if run <= len(players_information_all_runs):
-        players_information = [players_information_all_runs[run-1]]
-    else:
-        players_information = []
+    players_information = larp.get_players_missing_information(run_id=run)
     context = {"larp": larp.name, "run": run,
                "players_information": players_information}
     return render(request, template, context)
@@ -187,8 +198,8 @@ def players_list(request, larp_id = None, run_id = None):
     if not run_id:
         run_id = 1
 
-    for larp in Larp.objects.all():
-        runs = larp.get_number_of_runs()
+    for larp in Larp.objects.with_number_of_runs():
+        runs = larp.number_of_runs
         #Reuse loop to get current larp runs
         if current_larp.id == larp.id:
             current_larp_runs = runs
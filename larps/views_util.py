@@ -1,10 +1,13 @@
+from django.core.paginator import Paginator
 from .models import *
 
 def find_character(user, larp, run):
-    assigments = larp.get_character_assigments()
-    for a in assigments:
-        if (a.user == user) and (a.run == run):
-            return a.character
+    if not user.is_authenticated:
+        return None
+    assigment = CharacterAssigment.objects.filter(user=user, run=run, larp=larp).select_related(
+        'character').order_by('id').first()
+    if assigment:
+        return assigment.character
 
 def build_context(request, larp_id, run):
     larp = Larp.objects.get(id=larp_id)
@@ -17,12 +20,7 @@ def build_context(request, larp_id, run):
 
 
 def get_measurements(user):
-    measurements_search = PlayerMeasurement.objects.filter(user=user)
-    if len(measurements_search) == 0:
-        measurements = PlayerMeasurement(user=user)
-    else:
-        measurements = measurements_search[0]
-    return measurements
+    return PlayerMeasurement.objects.get_or_insert(user=user)
 
 # BOOKINGS
 
@@ -32,16 +30,15 @@ def generate_bookings(user):
         booking = assigment.get_bookings()
 
 def get_bookings(user, larp, run):
-    bookings_list = Bookings.objects.filter(user=user, larp=larp, run=run)
-    if len(bookings_list) == 0: return None
-    return bookings_list[0]
+    return Bookings.objects.filter(user=user, larp=larp, run=run).first()
 
 
 # CHARACTERS
 
-def get_characters(larp):
-    larp_characters = []
-    for character in Character.objects.all():
-        if character.group.larp == larp:
-            larp_characters.append(character)
-    return larp_characters
+CHARACTERS_PER_PAGE = 50
+
+# returns one page of the characters of the larp, by group and name.
+def get_characters(larp, page=None):
+    characters = Character.objects.filter(group__larp=larp).select_related('group', 'race').order_by(
+        'group__name', 'name', 'id')
+    return Paginator(characters, CHARACTERS_PER_PAGE).get_page(page)
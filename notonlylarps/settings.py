@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -93,6 +94,25 @@ else:
     }
 
 
+# Cache shared by the web server and the import worker, its table is created by the migrations
+# The progress of the import jobs is kept out of the database, where the import transaction
+# would hide it until the end.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'larps_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'import_progress': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(tempfile.gettempdir(), 'notonlylarps_import_progress'),
+        'TIMEOUT': 24 * 60 * 60,
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -132,6 +152,10 @@ STATIC_ROOT = ''
 STATIC_URL = '/static/'
 STATICFILES_DIRS = ( os.path.join('static'), )
 
+# CSV files waiting to be imported by manage.py run_import_jobs. They have the emails of the
+# players: they are kept out of the project folder and deleted once imported.
+IMPORT_FILES_ROOT = os.getenv('IMPORT_FILES_ROOT', os.path.join(tempfile.gettempdir(), 'notonlylarps_imports'))
+
 LOGIN_REDIRECT_URL = '/'
 
 # Email in development